@@ -1,30 +1,56 @@
+import argparse
 import requests
 import os
-from audiobook import concatenate_audio_pydub, load_chapters_from_yaml
+from audio import CODECS
+from chapters import load_chapters_from_yaml
+from downloads import Downloader
+from export import export_book, export_chapters, page_audio_paths
 
-def get_list():
-    response = requests.get("https://maxtheman--list-waves-dev.modal.run")
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(response.status_code)
+def get_list(chapter=None, modified_since=None):
+    '''Every page the server has audio for, fetched a page of results at a time'''
+    files = []
+    params = {"chapter": chapter, "modified_since": modified_since, "offset": 0}
+    while params["offset"] is not None:
+        response = requests.get("https://maxtheman--list-waves-dev.modal.run", params=params)
+        if response.status_code != 200:
+            print(response.status_code)
+            return files
+        listing = response.json()
+        files += listing["files"]
+        params["offset"] = listing["next_offset"]
+    return files
 
-def download(name, size):
-    response = requests.get(f"https://maxtheman--download-waves-dev.modal.run?dir_name={name}")
-    if response.status_code == 200:
-        #check file size
-        if len(response.content) != size:
-            raise Exception("File size does not match")
-        local_directory = f"final_combined_wavs/"
-        if not os.path.exists(local_directory):
-            os.makedirs(local_directory)
-        new_dir_name = int(name)
-        new_file_name = f"{new_dir_name}.wav"
-        new_file_path = os.path.join(local_directory, new_file_name)
-        with open(new_file_path, 'wb') as f:
-            f.write(response.content)
-    else:
-        print(response.status_code)
+def download_job(file, local_directory="final_combined_wavs/"):
+    '''(url, path, size, sha256) for one entry of get_list(), for Downloader.fetch_all'''
+    name = file['dir']
+    new_file_name = f"{int(name)}{CODECS[file.get('codec', 'wav')][2]}"
+    return (f"https://maxtheman--download-waves-dev.modal.run?dir_name={name}",
+            os.path.join(local_directory, new_file_name), file['size'], file.get('sha256'))
+
+def is_downloaded(job):
+    _, path, size, _ = job
+    return os.path.exists(path) and os.path.getsize(path) == size
+
+def download(files, chapters, workers=8):
+    '''Fetch each chapter's missing pages as one streamed archive, unpacked as it arrives.
+    Pages an archive didn't bring, e.g. after a dropped connection, are then downloaded one by one
+    in parallel over one session, resuming partial files.'''
+    os.makedirs("final_combined_wavs/", exist_ok=True)
+    downloader = Downloader(workers=workers)
+    jobs = {int(file['dir']): download_job(file) for file in files}
+    for chapter in chapters:
+        pages = range(chapter.chapter_start_page, chapter.chapter_end_page + 1)
+        if all(is_downloaded(jobs[page]) for page in pages if page in jobs):
+            continue
+        try:
+            downloader.fetch_archive("https://maxtheman--archive-waves-dev.modal.run", "final_combined_wavs/",
+                                     {"start_page": pages[0], "end_page": pages[-1]})
+        except Exception as e:
+            print(f"chapter {chapter.chapter_number} archive: {e}")
+    failures = downloader.fetch_all([job for job in jobs.values() if not is_downloaded(job)])
+    for path, error in failures.items():
+        print(f"{path}: {error}")
+    return failures
 
 def delete(dir_name):
     response = requests.get(f"https://maxtheman--delete-waves-dev.modal.run?dir_name={dir_name}")
@@ -34,24 +60,21 @@ def delete(dir_name):
         print(response.status_code)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download page audio and export it as an audiobook")
+    parser.add_argument("--codec", default="m4b", choices=list(CODECS),
+                        help="codec of the exported audio; m4b and opus keep chapter markers")
+    parser.add_argument("--per-chapter", action="store_true",
+                        help="write one file per chapter instead of one book file with chapter markers")
+    parser.add_argument("--workers", type=int, default=8, help="parallel downloads of pages the chapter archives missed")
+    args = parser.parse_args()
     all_files = get_list()
     chapters = load_chapters_from_yaml('chapters.yaml')
     # check if the file dirs are pages in chapters
-    files_in_chapters = []
-    for file in all_files:
-        name = int(file['dir'])
-        for chapter in chapters:
-            if chapter.chapter_start_page <= name <= chapter.chapter_end_page:
-                files_in_chapters.append(file)
-                break
-    for file in files_in_chapters:
-        name = file['dir']
-        size = file['size']
-        download(name, size)
-    for chapter in chapters:
-        concatenate_audio_pydub("final_combined_wavs/", f"chapter_{chapter.chapter_number}.wav")
-        # move files to subdirectory to clean up
-        os.makedirs(f"final_combined_wavs/chapter_{chapter.chapter_number}", exist_ok=True)
-        for file in os.listdir("final_combined_wavs/"):
-            if file.endswith(".wav"):
-                os.rename(f"final_combined_wavs/{file}", f"final_combined_wavs/chapter_{chapter.chapter_number}/{file}")
\ No newline at end of file
+    files_in_chapters = [file for file in all_files if chapters.in_scope(int(file['dir']))]
+    download(files_in_chapters, chapters, args.workers)
+    # pages are assigned to chapters by their ranges, so the export doesn't depend on what else is in the directory
+    page_audio = page_audio_paths("final_combined_wavs/")
+    if args.per_chapter:
+        export_chapters(chapters, page_audio, "final_combined_wavs/chapters/", args.codec)
+    else:
+        export_book(chapters, page_audio, f"book{CODECS[args.codec][2]}", args.codec)
@@ -0,0 +1,61 @@
+"""Tar archives of page audio streamed in both directions: the server builds the archive as it sends it,
+and the client unpacks each file as it arrives. Neither side stages the archive or holds a whole file."""
+import hashlib
+import os
+import tarfile
+
+BLOCK = tarfile.BLOCKSIZE
+
+
+def iter_tar(files, block_size=1 << 20):
+    """Yield a tar archive of (name in archive, path, sha256 or None) entries, built as it is sent.
+    Each member carries its SHA-256 in a pax header so the client can check it. Exactly the size
+    in the member's header is sent, so a file rewritten while it streams can't shift the members
+    after it; one that shrank stops the archive with an error."""
+    for name, path, sha256 in files:
+        info = tarfile.TarInfo(name)
+        stat = os.stat(path)
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        if sha256:
+            info.pax_headers = {"SHA256": sha256}
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+        with open(path, "rb") as f:
+            remaining = info.size
+            while remaining > 0:
+                block = f.read(min(block_size, remaining))
+                if not block:
+                    raise ValueError("{0}: shorter than its archive header; changed while streaming".format(path))
+                remaining -= len(block)
+                yield block
+        if info.size % BLOCK:
+            yield b"\0" * (BLOCK - info.size % BLOCK)
+    yield b"\0" * (2 * BLOCK)  # end of archive
+
+
+def unpack_tar(fileobj, directory, chunk_size=1 << 20):
+    """Extract a streamed tar into directory member by member as it is read, checking each member's
+    SHA-256 when the archive has one. Each file is written to <name>.part and moved into place once
+    complete, so an interrupted stream leaves no truncated files. Returns the paths written."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        for member in tar:
+            name = os.path.basename(member.name)
+            if not member.isfile() or not name:
+                continue  # only flat files; never follow paths out of directory
+            path = os.path.join(directory, name)
+            partial_path = path + ".part"
+            digest = hashlib.sha256()
+            source = tar.extractfile(member)
+            with open(partial_path, "wb") as f:
+                for chunk in iter(lambda: source.read(chunk_size), b""):
+                    f.write(chunk)
+                    digest.update(chunk)
+            expected = member.pax_headers.get("SHA256")
+            if expected and digest.hexdigest() != expected:
+                os.remove(partial_path)
+                raise ValueError("{0}: checksum does not match".format(member.name))
+            os.replace(partial_path, path)
+            paths.append(path)
+    return paths
@@ -0,0 +1,227 @@
+"""Audio assembly. Kept free of the TTS/ML stack so the download client and server tooling import it quickly;
+tqdm is only imported on the paths that use it, and compressed audio goes through the ffmpeg binary."""
+import os
+import subprocess
+import wave
+
+# ffmpeg encoder, default bitrate and file extension of each output codec
+CODECS = {
+    "wav": (None, None, ".wav"),
+    "opus": ("libopus", "32k", ".opus"),
+    "aac": ("aac", "64k", ".m4a"),
+    "mp3": ("libmp3lame", "64k", ".mp3"),
+    # AAC in an audiobook container, which players show chapters for
+    "m4b": ("aac", "64k", ".m4b"),
+}
+EXTENSIONS = {extension: codec for codec, (_, _, extension) in CODECS.items()}
+# Codec for page and chapter audio; chunk audio is always WAV
+OUTPUT_CODEC = os.getenv("AUDIOBOOK_CODEC", "opus")
+# Raw PCM format names ffmpeg uses for each sample width
+SAMPLE_FORMATS = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+# PCM layout assumed for inputs that aren't WAV: XTTS output, 24 kHz mono 16-bit
+DEFAULT_PCM = (1, 2, 24000)
+
+
+def codec_for_path(path):
+    return EXTENSIONS[os.path.splitext(path)[1]]
+
+
+def audio_file_name(stem, codec=None):
+    return stem + CODECS[codec or OUTPUT_CODEC][2]
+
+
+def pcm_params(path):
+    """(channels, sample width, frame rate) of a WAV file, or DEFAULT_PCM for anything else"""
+    try:
+        with wave.open(path, "rb") as clip:
+            return clip.getnchannels(), clip.getsampwidth(), clip.getframerate()
+    except (wave.Error, EOFError):
+        return DEFAULT_PCM
+
+
+def ffmpeg_pcm_args(nchannels, sampwidth, framerate):
+    return ["-f", SAMPLE_FORMATS[sampwidth], "-ar", str(framerate), "-ac", str(nchannels)]
+
+
+def partial_path(output_path):
+    """Where output_path is written before it is moved into place; keeps the extension ffmpeg reads the format from"""
+    stem, extension = os.path.splitext(output_path)
+    return "{0}.{1}.partial{2}".format(stem, os.getpid(), extension)
+
+
+def remove_partial(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class FfmpegEncoder:
+    """Encodes PCM frames with ffmpeg as they are written, so the clip is never held in memory.
+    The file is only moved to output_path once ffmpeg succeeds, so a download or archive that
+    reads it meanwhile gets the previous version, never a truncated one."""
+
+    def __init__(self, output_path, codec, nchannels, sampwidth, framerate, bitrate=None):
+        encoder, default_bitrate, _ = CODECS[codec]
+        self.output_path = output_path
+        self.partial_path = partial_path(output_path)
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-y", "-loglevel", "error"]
+            + ffmpeg_pcm_args(nchannels, sampwidth, framerate)
+            + ["-i", "pipe:0", "-c:a", encoder, "-b:a", bitrate or default_bitrate, self.partial_path],
+            stdin=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def writeframes(self, data):
+        self.process.stdin.write(data)
+
+    def close(self):
+        self.process.stdin.close()
+        error = self.process.stderr.read()
+        if self.process.wait() != 0:
+            remove_partial(self.partial_path)
+            raise RuntimeError("ffmpeg failed: " + error.decode("utf-8", "replace"))
+        os.replace(self.partial_path, self.output_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.process.kill()
+            self.process.wait()
+            remove_partial(self.partial_path)
+
+
+class WavEncoder:
+    """Writes PCM frames to a WAV file, moved to output_path once it is complete"""
+
+    def __init__(self, output_path, nchannels, sampwidth, framerate):
+        self.output_path = output_path
+        self.partial_path = partial_path(output_path)
+        self.output = wave.open(self.partial_path, "wb")
+        self.output.setnchannels(nchannels)
+        self.output.setsampwidth(sampwidth)
+        self.output.setframerate(framerate)
+
+    def writeframes(self, data):
+        self.output.writeframes(data)
+
+    def close(self):
+        self.output.close()
+        os.replace(self.partial_path, self.output_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.output.close()
+            remove_partial(self.partial_path)
+
+
+def open_encoder(output_path, nchannels, sampwidth, framerate, codec=None, bitrate=None):
+    """A writer with writeframes() for output_path; the codec defaults to the path's extension"""
+    codec = codec or codec_for_path(output_path)
+    if codec == "wav":
+        return WavEncoder(output_path, nchannels, sampwidth, framerate)
+    return FfmpegEncoder(output_path, codec, nchannels, sampwidth, framerate, bitrate)
+
+
+def iter_pcm(path, nchannels, sampwidth, framerate, block_frames=65536):
+    """Yield a clip's PCM in blocks, in the given layout. WAVs already in that layout are read
+    directly; anything else is decoded and converted by ffmpeg as it streams."""
+    try:
+        with wave.open(path, "rb") as clip:
+            if (
+                clip.getnchannels() == nchannels
+                and clip.getsampwidth() == sampwidth
+                and clip.getframerate() == framerate
+            ):
+                frames = clip.readframes(block_frames)
+                while frames:
+                    yield frames
+                    frames = clip.readframes(block_frames)
+                return
+    except (wave.Error, EOFError):
+        pass  # not plain PCM, let ffmpeg decode it below
+    process = subprocess.Popen(
+        ["ffmpeg", "-loglevel", "error", "-i", path]
+        + ffmpeg_pcm_args(nchannels, sampwidth, framerate)
+        + ["pipe:1"],
+        stdout=subprocess.PIPE,
+    )
+    block_bytes = block_frames * nchannels * sampwidth
+    try:
+        data = process.stdout.read(block_bytes)
+        while data:
+            yield data
+            data = process.stdout.read(block_bytes)
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode {path}")
+
+
+def concatenate_audio(audio_clip_paths, output_path, codec=None, bitrate=None, verbose=0, block_frames=65536):
+    """Stream the PCM of each clip into output_path in a single pass, encoding it as it goes.
+    Memory use is bounded by block_frames regardless of total length. The output takes the
+    sample rate, width and channel count of the first clip; other clips are converted to match."""
+    if not audio_clip_paths:
+        raise ValueError("No audio clips provided")
+    params = pcm_params(audio_clip_paths[0])
+    if verbose:
+        from tqdm import tqdm
+
+        audio_clip_paths = tqdm(audio_clip_paths, "Concatenating audio files")
+    with open_encoder(output_path, *params, codec=codec, bitrate=bitrate) as output:
+        for clip_path in audio_clip_paths:
+            for frames in iter_pcm(clip_path, *params, block_frames=block_frames):
+                output.writeframes(frames)
+    return output_path
+
+
+def concatenate_wavs(audio_clip_paths, output_path, verbose=0, block_frames=65536):
+    """Concatenate clips into one WAV file"""
+    return concatenate_audio(audio_clip_paths, output_path, "wav", verbose=verbose, block_frames=block_frames)
+
+
+def concatenate_audio_pydub(path, output_file_name, verbose=1, codec=None):
+    """Concatenate all the numbered audio files in the directory (0.wav, 1.opus, ...) in order and export
+    the final audio file, encoded by codec or by the output file name's extension.
+    Ignores and overwrites the output file name if it's already present in the directory."""
+    # List and sort the audio files in the directory
+    audio_file_names = [
+        name
+        for name in os.listdir(path)
+        if os.path.splitext(name)[0].isdigit()
+        and os.path.splitext(name)[1] in EXTENSIONS
+        and name != output_file_name
+    ]
+    audio_file_names.sort(key=lambda x: int(os.path.splitext(x)[0]))
+
+    audio_clip_paths = [os.path.join(path, name) for name in audio_file_names]
+
+    output_path = os.path.join(path, output_file_name)
+    return concatenate_audio(audio_clip_paths, output_path, codec, verbose=verbose)
+
+
+def audio_duration(path):
+    """Length of an audio file in seconds, from the WAV header or else from ffprobe"""
+    try:
+        with wave.open(path, "rb") as clip:
+            return clip.getnframes() / clip.getframerate()
+    except (wave.Error, EOFError):
+        pass
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip())
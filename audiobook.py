@@ -1,17 +1,33 @@
 from TTS.api import TTS
 import TTS.utils.synthesizer as Synth
 import torch
-from litellm import completion
+import asyncio
 import base64
+import hashlib
+import importlib.metadata
+import json
+import mimetypes
 import os
-from pydub import AudioSegment
 from tqdm import tqdm
-from functools import reduce
 import fitz
-import yaml
 import re
+import time
 from pydantic import BaseModel
 from enum import Enum
+from audio import OUTPUT_CODEC, audio_file_name, concatenate_wavs, concatenate_audio_pydub
+from cache import DiskCache, file_sha256
+from catalog import Catalog
+from chapters import (Chapter, ChapterMap, load_chapters_from_yaml, header_and_footer_for_page, chapter_for_page,
+                      chapter_map)
+from chunking import chunk_text, split_sentences
+import extraction
+from extraction import ExtractedPage, extract_pages, pdf_page_hash
+from figure_registry import FigureRegistry
+from figures import detect_figures, prepare_figure_image
+from layout import text_without_lines
+from llm_client import AsyncLLMClient, run_sync
+from manifest import Manifest
+from text_quality import TextQualityClassifier, normalize_text
 
 def custom_split_sentence(synthesizer: Synth.Synthesizer, text):
     segments = synthesizer.seg.segment(text)
@@ -47,12 +63,12 @@ def custom_split_sentence(synthesizer: Synth.Synthesizer, text):
 Synth.Synthesizer.split_into_sentences = custom_split_sentence
 
 
+TTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+
+
 def setup_tts(override_device=None):
     os.environ["COQUI_TOS_AGREED"] = "1"
-    if os.getenv("USER") != "max":  # hack - only use relative on local system
-        os.environ["TTS_HOME"] = "/outputs/models/"
-    else:
-        os.environ["TTS_HOME"] = "outputs/models/"
+    os.environ["TTS_HOME"] = os.path.join(get_outputs_dir(), "models") + "/"
     if torch.cuda.is_available():
         device = "cuda"
     elif torch.backends.mps.is_available():
@@ -62,7 +78,7 @@ def setup_tts(override_device=None):
         device = "cpu"
 
     torch.set_default_device(device)
-    tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2")
+    tts = TTS(TTS_MODEL)
     tts.to(device)
     if override_device:
         device = override_device
@@ -72,6 +88,67 @@ def setup_tts(override_device=None):
     return tts
 
 
+_outputs_dir = None
+
+
+def get_outputs_dir():
+    # set by a local backend's pool processes; Modal containers use the /outputs volume
+    if _outputs_dir is not None:
+        return _outputs_dir
+    if os.getenv("USER") != "max":  # hack - only use relative on local system
+        return "/outputs"
+    return "outputs"
+
+
+# Bump a prompt's version whenever its template changes, so cached responses to the old prompt miss
+PROMPT_VERSIONS = {
+    "specific_image": 1,
+    "general_cleanup": 1,
+    "image_present": 1,
+    "page_figures": 1,
+    # not a prompt, but deciding which pages skip cleanup changes their text the same way
+    "text_quality": 1,
+}
+
+llm_cache = DiskCache(os.path.join(get_outputs_dir(), "cache", "llm"))
+# One client per process, so every page in flight shares the same rate limits
+llm_client = AsyncLLMClient()
+# Counts how many pages this process sent to the cleanup LLM and how many it skipped
+text_quality = TextQualityClassifier()
+# Synthesized chunk audio, shared by every TTS worker through the outputs volume
+audio_cache = DiskCache(os.path.join(get_outputs_dir(), "cache", "audio"), max_bytes=8 * 1024**3)
+# Bump whenever synthesis settings change, so audio cached with the old settings misses
+AUDIO_CACHE_VERSION = 1
+
+
+def use_outputs_dir(outputs_dir):
+    """Point this process's outputs, caches included, at outputs_dir. The local backend's pool
+    processes call this before their first task, whether or not audiobook was already imported."""
+    global _outputs_dir, llm_cache, audio_cache
+    _outputs_dir = outputs_dir
+    llm_cache = DiskCache(os.path.join(outputs_dir, "cache", "llm"))
+    audio_cache = DiskCache(os.path.join(outputs_dir, "cache", "audio"), max_bytes=8 * 1024**3)
+    _figure_registries.clear()
+
+
+async def acached_llm_response(model, prompt_name, text, image, call):
+    """Return the cached response for this model, prompt version, text and image, or await call() and cache it.
+    image: raw image bytes sent with the prompt, or None"""
+    key = DiskCache.key(
+        model.value if isinstance(model, LLM) else model,
+        prompt_name,
+        PROMPT_VERSIONS[prompt_name],
+        text,
+        hashlib.sha256(image).hexdigest() if image else None,
+    )
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached.decode("utf-8")
+    response = await call()
+    llm_cache.put(key, response.encode("utf-8"))
+    return response
+
+
 class LLM(Enum):
     LLAVA = "ollama/llava"
     HAIKU = "claude-haiku"
@@ -80,8 +157,8 @@ class LLM(Enum):
     GPT_4_O = "gpt-4o"
 
 
-def get_llm_response(model: LLM, messages, images=None) -> str:
-    """Responsible for making the completions from LiteLLM"""
+async def aget_llm_response(model: LLM, messages, images=None) -> str:
+    """Responsible for making the completions from LiteLLM, through the rate-limited client"""
     messages = messages
     _images = []
     max_tokens = 4000
@@ -104,24 +181,27 @@ def get_llm_response(model: LLM, messages, images=None) -> str:
             params["images"] = _images
         else:
             params["images"] = [_images]
-    response = completion(**params)
-    return response.choices[0].message.content
+    return await llm_client.complete(**params)
 
 
-def describe_image(
+def get_llm_response(model: LLM, messages, images=None) -> str:
+    return run_sync(aget_llm_response(model, messages, images))
+
+
+async def adescribe_image(
     image_uri,
     figure_name,
     surrounding_text,
     model=LLM.GPT_VISION,
     mode="specific_image",
+    image_bytes=None,
+    mime_type=None,
 ):
+    """image_bytes/mime_type: an already encoded image to send instead of reading image_uri"""
     if type(model) is str:
         model = LLM(model)
-    if image_uri is None:
+    if image_uri is None and image_bytes is None:
         raise ValueError("No image provided")
-    if open(image_uri, "rb").read() is None:
-        raise ValueError("Image could not be read")
-    image = base64.b64encode(open(image_uri, "rb").read()).decode("utf-8")
     if mode == "specific_image":
         message = "Please describe the picture named {0} on this page. How is it related to the following text? Text: {1} Describe its importance to the passage, in detail. Describe the image directly as if you were writing a description in a book, e.g., say 'the image is' instead of 'the image you shared is', for example.".format(
             figure_name, surrounding_text
@@ -130,17 +210,36 @@ def describe_image(
         message = "The following text is from an OCR of a page. Obey the following rules exactly — failure to do so could result in user misunderstanding and harm. You have the original image of the page attached. Your job is to validate the work and clean up the OCR. If the page contains images or figures, ignore their presence. Please provide a cleaned up version of this text that could easily be passed to a text-to-speech program, removing any obvious grammatical errors resulting from the OCR of the page. More formal texts may have chapter names at the start of the page — remove these if they don't make sense inline with the text. The downstream program can only handle english and numbers, so mathematical symbols, tables, and special characters — including brackets — should all be clarified. Remove extraneous characters if they have been added, and for easy listening add additonal language if it's not clear that something is a title, or that it's about to transition to a table or math equation, for example. Do NOT add summaries of the page — this is just one page of the book, the author will summarize if appropriate. If you are unable to clarify, leave it as is. Apart from these instructions, do NOT take liberties with the text. Here is the text {0}".format(
             surrounding_text
         )
-        response = completion(
-            model="gpt-4-1106-preview",
-            max_tokens=4000,
-            messages=[{"content": message, "role": "user"}],
+        # the page image isn't sent with the cleanup prompt, so it isn't part of the key either
+        return await acached_llm_response(
+            LLM.GPT_TURBO,
+            mode,
+            surrounding_text,
+            None,
+            lambda: llm_client.complete(
+                model="gpt-4-1106-preview",
+                max_tokens=4000,
+                messages=[{"content": message, "role": "user"}],
+            ),
         )
-        return response.choices[0].message.content
+    if image_bytes is None:
+        with open(image_uri, "rb") as f:
+            image_bytes = f.read()
+        mime_type = mimetypes.guess_type(image_uri)[0]
+    if not image_bytes:
+        raise ValueError("Image could not be read")
+    image = base64.b64encode(image_bytes).decode("utf-8")
     if model == LLM.LLAVA:
         messages = [{"content": message, "role": "user"}]
-        return get_llm_response(model, messages, image)
+        return await acached_llm_response(
+            model,
+            mode,
+            message,
+            image_bytes,
+            lambda: aget_llm_response(model, messages, image),
+        )
     if model == LLM.GPT_VISION:
-        base64_full_image = f"data:image/jpeg;base64,{image}"
+        base64_full_image = f"data:{mime_type or 'image/png'};base64,{image}"
         messages = [
             {
                 "content": [
@@ -155,75 +254,86 @@ def describe_image(
                 "role": "user",
             }
         ]
-        return get_llm_response(model, messages)
+        return await acached_llm_response(
+            model,
+            mode,
+            message,
+            image_bytes,
+            lambda: aget_llm_response(model, messages),
+        )
     else:
         raise ValueError(f"{model} not supported")
 
 
-def chunk_text(
-    text, max_length, page_image, described_figures=None, handle_figures=False
+def describe_image(
+    image_uri,
+    figure_name,
+    surrounding_text,
+    model=LLM.GPT_VISION,
+    mode="specific_image",
+    image_bytes=None,
+    mime_type=None,
 ):
-    if described_figures is None:
-        described_figures = set()
-
-    sentences = text.split(".")
-    chunks = []
-    current_chunk = []
-
-    for sentence in sentences:
-        words = sentence.split()
-        for word in words:
-            # Check if adding the next word exceeds the max length
-            if len(" ".join(current_chunk + [word])) > max_length:
-                # Add the current chunk to the chunks list
-                chunks.append(" ".join(current_chunk))
-                # Start a new chunk with the current word
-                current_chunk = [word]
-            else:
-                # Add the word to the current chunk
-                current_chunk.append(word)
-
-        # Add the last chunk if it's not empty
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = []
-
-    described_figures = set()
-    return chunks, described_figures
-
-
-def concatenate_audio_pydub(path, output_file_name, verbose=1):
-    """Concatenate all the audio files in the directory and export the final audio file. Ignores and overwrites the output file name if it's already present in the directory."""
-    # List and sort the audio files in the directory
-    audio_file_names = os.listdir(path)
-    audio_file_names = [
-        name
-        for name in audio_file_names
-        if name.endswith(".wav") and name != output_file_name
-    ]
-    audio_file_names.sort(key=lambda x: int(os.path.splitext(os.path.basename(x))[0]))
-
-    audio_clip_paths = [os.path.join(path, name) for name in audio_file_names]
-
-    if verbose:
-        audio_clip_paths = tqdm(audio_clip_paths, "Reading audio files")
-
-    # Read the audio files and add them to the clips list
-    clips = [
-        AudioSegment.from_file(clip_path, format="wav")
-        for clip_path in audio_clip_paths
-    ]
-
-    if not clips:
-        raise ValueError("No audio clips provided")
+    return run_sync(
+        adescribe_image(
+            image_uri, figure_name, surrounding_text, model, mode, image_bytes, mime_type
+        )
+    )
 
-    # Use reduce to concatenate the clips
-    final_clip = reduce(lambda x, y: x + y, clips)
 
-    # Export the final concatenated audio
-    output_path = os.path.join(path, output_file_name)
-    final_clip.export(output_path, format="wav")
-    return output_path
+async def adescribe_figures(figure_images, surrounding_text, model=LLM.GPT_VISION):
+    """Describe every figure on a page in a single vision call.
+    figure_images: dict of figure name to (encoded image bytes, mime type) of its cropped region
+    Returns a dict of figure name to description."""
+    if type(model) is str:
+        model = LLM(model)
+    figure_names = list(figure_images)
+    if len(figure_names) == 1:
+        image_bytes, mime_type = figure_images[figure_names[0]]
+        description = await adescribe_image(
+            None,
+            figure_names[0],
+            surrounding_text,
+            model,
+            image_bytes=image_bytes,
+            mime_type=mime_type,
+        )
+        return {figure_names[0]: description}
+    if model != LLM.GPT_VISION:
+        raise ValueError(f"{model} not supported")
+    message = "These are the pictures named {0}, each shown after its name. For each one, describe the picture and how it is related to the following text. Text: {1} Describe its importance to the passage, in detail. Describe each image directly as if you were writing a description in a book, e.g., say 'the image is' instead of 'the image you shared is', for example. Reply with only a JSON object whose keys are exactly the picture names and whose values are the descriptions.".format(
+        ", ".join(figure_names), surrounding_text
+    )
+    content = [message]
+    images_hash = hashlib.sha256()
+    for figure_name, (image_bytes, mime_type) in figure_images.items():
+        image = base64.b64encode(image_bytes).decode("utf-8")
+        content.append(figure_name)
+        content.append(
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image}"}}
+        )
+        images_hash.update(image_bytes)
+    messages = [{"content": content, "role": "user"}]
+    response = await acached_llm_response(
+        model,
+        "page_figures",
+        message,
+        images_hash.digest(),
+        lambda: aget_llm_response(model, messages),
+    )
+    match = re.search(r"\{.*\}", response, re.DOTALL)
+    try:
+        descriptions = json.loads(match.group(0)) if match else {}
+    except json.JSONDecodeError:
+        descriptions = {}
+    descriptions = {
+        name: descriptions.get(name, descriptions.get("Figure " + name, ""))
+        for name in figure_names
+    }
+    if not any(descriptions.values()):
+        # a reply that isn't the JSON asked for still describes the page: keep it once, on the first figure
+        descriptions[figure_names[0]] = response
+    return descriptions
 
 
 class Figures(BaseModel):
@@ -239,48 +349,159 @@ class PydanticPage(BaseModel):
     page_image_uri: str
     page_audio_uri: str
     figures: list[Figures]
+    llm_cleanup: bool = True
 
 
 class Page:
+    """A page of the book, built in lazy stages: render, extract, strip header/footer and cleanup.
+    Each stage runs at most once per page and memoizes its result; render and cleanup
+    are skipped entirely when their output from an earlier run is already on disk."""
+
     def __init__(
         self,
         page: fitz.Page,
         page_number: int,
         header_and_footer={"header": None, "footer": None},
     ):
-        self.page_audio_uri = "outputs/pages/{0}/audio".format(page_number)
-        self.page_image_uri = "outputs/pages/{0}/image".format(page_number)
-        if os.getenv("USER") != "max":  # if not local
-            self.page_audio_uri = "/outputs/pages/{0}/audio".format(page_number)
-            self.page_image_uri = "/outputs/pages/{0}/image".format(page_number)
-        if not os.path.exists(self.page_audio_uri):
-            os.makedirs(self.page_audio_uri)
-        if not os.path.exists(self.page_image_uri):
-            os.makedirs(self.page_image_uri)
-        full_image_path = self.page_image_uri + "/page.png"
-        page_image = page.get_pixmap().save(full_image_path)
+        page_dir = os.path.join(get_outputs_dir(), "pages", str(page_number))
+        self.page_audio_uri = os.path.join(page_dir, "audio")
+        self.page_image_uri = os.path.join(page_dir, "image")
+        self.page_text_uri = os.path.join(page_dir, "text")
+        for uri in (self.page_audio_uri, self.page_image_uri, self.page_text_uri):
+            if not os.path.exists(uri):
+                os.makedirs(uri)
+        self.page = page
         self.page_number = page_number
-        self.page_text = page.get_text()
-        if header_and_footer["header"]:
-            header = header_and_footer["header"]
-            if self.page_text.startswith(header):
-                self.page_text = self.page_text[len(header) :]
-        if header_and_footer["footer"]:
-            footer = header_and_footer["footer"]
-            if self.page_text.endswith(footer):
-                self.page_text = self.page_text[: -len(footer)]
-        self.cleaned_text = describe_image(
-            full_image_path, "", self.page_text, mode="general_cleanup"
-        )
+        self.header_and_footer = header_and_footer
+        self.full_image_path = self.page_image_uri + "/page.png"
+        self._rendered = False
+        self._page_image = None
+        self._raw_text = None
+        self._page_text = None
+        self._cleaned_text = None
+        self._blocks = None
+        self._detected_figures = None
+        self.llm_cleanup = None
+        self._figure_images = {}
         self.figures = []
         self.final_text_list = []
 
+    def render(self, force=False):
+        """Save the page image, unless it was already saved by this or an earlier run"""
+        if force or not (self._rendered or os.path.exists(self.full_image_path)):
+            self.page.get_pixmap().save(self.full_image_path)
+        self._rendered = True
+        return self.full_image_path
+
+    def page_image(self):
+        """PNG bytes of the whole page, read once and kept in memory"""
+        if self._page_image is None:
+            with open(self.render(), "rb") as f:
+                self._page_image = f.read()
+        return self._page_image
+
+    def extract(self):
+        """Raw text of the page"""
+        if self._raw_text is None:
+            self._raw_text = self.page.get_text()
+        return self._raw_text
+
+    def strip_header_footer(self):
+        """Page text with the chapter's header and footer removed.
+        header_and_footer may also carry a "mask" of detected running lines to leave out."""
+        if self._page_text is None:
+            if self.header_and_footer.get("mask"):
+                page_text = text_without_lines(self.blocks(), self.header_and_footer["mask"])
+            else:
+                page_text = self.extract()
+            header = self.header_and_footer["header"]
+            footer = self.header_and_footer["footer"]
+            if header and page_text.startswith(header):
+                page_text = page_text[len(header) :]
+            if footer and page_text.endswith(footer):
+                page_text = page_text[: -len(footer)]
+            self._page_text = page_text
+        return self._page_text
+
+    def cleanup(self, force=False):
+        return run_sync(self.acleanup(force))
+
+    async def acleanup(self, force=False):
+        """Cleaned page text, from the LLM only when the text quality classifier says the page needs it;
+        clean pages just get normalize_text. The result is saved next to a hash of the text it was
+        made from and the cleanup and classifier versions, so a later run only cleans the page
+        again if the page text changed or one of those versions was bumped."""
+        if self._cleaned_text is not None and not force:
+            return self._cleaned_text
+        page_text = self.strip_header_footer()
+        text_hash = hashlib.sha256(page_text.encode("utf-8")).hexdigest()
+        versions = {name: PROMPT_VERSIONS[name] for name in ("general_cleanup", "text_quality")}
+        cleaned_path = self.page_text_uri + "/cleaned.json"
+        if not force and os.path.exists(cleaned_path):
+            with open(cleaned_path, "r") as f:
+                saved = json.load(f)
+            if saved["text_sha256"] == text_hash and saved.get("versions") == versions:
+                self._cleaned_text = saved["cleaned_text"]
+                self.llm_cleanup = saved.get("llm_cleanup", True)
+                return self._cleaned_text
+        self.llm_cleanup = text_quality.needs_cleanup(page_text, self.blocks())
+        if self.llm_cleanup:
+            self._cleaned_text = await adescribe_image(
+                self.render(), "", page_text, mode="general_cleanup"
+            )
+        else:
+            self._cleaned_text = normalize_text(page_text)
+        with open(cleaned_path, "w") as f:
+            json.dump(
+                {
+                    "text_sha256": text_hash,
+                    "versions": versions,
+                    "cleaned_text": self._cleaned_text,
+                    "llm_cleanup": self.llm_cleanup,
+                },
+                f,
+            )
+        return self._cleaned_text
+
+    @property
+    def page_text(self):
+        return self.strip_header_footer()
+
+    @property
+    def cleaned_text(self):
+        return self.cleanup()
+
     def set_figures(self, figures):
         self.figures = figures
 
     def set_final_text_list(self, final_text_list):
         self.final_text_list = final_text_list
 
+    def blocks(self):
+        """PyMuPDF text, image and span blocks of the page"""
+        if self._blocks is None:
+            self._blocks = self.page.get_text("dict")["blocks"]
+        return self._blocks
+
+    def detect_figures(self):
+        """Figures drawn on this page, matched to their captions"""
+        if self._detected_figures is None:
+            if isinstance(self.page, ExtractedPage):
+                self._detected_figures = self.page.figures
+            else:
+                self._detected_figures = detect_figures(self.page, self.blocks())
+        return self._detected_figures
+
+    def figure_image(self, figure_name):
+        """The figure's region of the page, rendered and encoded for the vision model"""
+        if figure_name not in self._figure_images:
+            if isinstance(self.page, ExtractedPage):
+                self._figure_images[figure_name] = self.page.figure_image(figure_name)
+            else:
+                figure = next(f for f in self.detect_figures() if f.figure_name == figure_name)
+                self._figure_images[figure_name] = prepare_figure_image(self.page, figure.bbox)
+        return self._figure_images[figure_name]
+
     def extract_figure_names(self):
         figure_regex = r"Figure (\d+\.\d+)"
         figure_names = re.findall(figure_regex, self.page_text)
@@ -290,9 +511,9 @@ class Page:
         prompt = "Looks at this page. Does it contain an image titled {0}? Return only the word True, or the word False.".format(
             figure_name
         )
-        image = open(self.page_image_uri + "/page.png", "rb").read()
+        image = self.page_image()
         image_base64 = base64.b64encode(image).decode("utf-8")
-        base_64image_encoded = f"data:image/jpeg;base64,{image_base64}"
+        base_64image_encoded = f"data:image/png;base64,{image_base64}"
         messages = [
             {
                 "content": [
@@ -307,7 +528,15 @@ class Page:
                 "role": "user",
             }
         ]
-        response = get_llm_response(LLM.GPT_VISION, messages)
+        response = run_sync(
+            acached_llm_response(
+                LLM.GPT_VISION,
+                "image_present",
+                prompt,
+                image,
+                lambda: aget_llm_response(LLM.GPT_VISION, messages),
+            )
+        )
         if "True" in response:
             return True
         else:
@@ -322,7 +551,8 @@ class Page:
             return self.cleaned_text
         final_text = "Description of images on page: "
         for figure in self.figures:
-            final_text += figure.figure_name + ": " + figure.figure_description + ". "
+            if figure.figure_description:  # empty when the page's one description is on another figure
+                final_text += figure.figure_name + ": " + figure.figure_description + ". "
         final_text += (
             "All images described. Continuing the main passage now: "
             + self.cleaned_text
@@ -335,30 +565,23 @@ class Page:
             page_text=self.combine_cleaned_text_and_descriptions(),
             final_text_list=self.final_text_list,
             page_image_uri=self.page_image_uri + "/page.png",
-            page_audio_uri=self.page_audio_uri + "/combined.wav",
+            page_audio_uri=self.page_audio_uri + "/" + audio_file_name("combined"),
             figures=self.figures,
+            llm_cleanup=self.llm_cleanup is not False,
         )
 
     def __str__(self):
         return self.page_text
 
 
-class Chapter(BaseModel):
-    chapter_number: int
-    chapter_title_header: str
-    chapter_title_footer: str
-    chapter_start_page: int
-    chapter_end_page: int
-
-
 class Doc(BaseModel):
     pages: list[PydanticPage]
     figures: list[Figures]
     chapters: list[Chapter]
 
 
-def make_page(
-    existing_figures: list[str],
+async def amake_page(
+    figure_registry: FigureRegistry,
     page,
     page_number,
     header_and_footer={"header": None, "footer": None},
@@ -366,31 +589,42 @@ def make_page(
     """Make a page from the fitz page and return a PydanticPage object
     page: page from fitz.open
     page_number: page number from fitz.open
-    existing_figures: list of figures already described in the document"""
-    working_page = Page(page, page_number)
-    if header_and_footer["header"] is None and header_and_footer["footer"] is None:
-        pass
+    figure_registry: the book's FigureRegistry; a figure is described by the one page that claims it
+    The cleanup and figure description calls for the page run concurrently."""
+    working_page = Page(page, page_number, header_and_footer)
+    # Figures are found from the PDF's image and drawing blocks; only the ones this page claims are its own
+    figure_names = [
+        name
+        for name in dict.fromkeys(figure.figure_name for figure in working_page.detect_figures())
+        if figure_registry.claim(name, page_number)
+    ]
+    # a rebuilt page reuses the descriptions it already stored; only undescribed figures go to the vision model
+    descriptions = {name: figure_registry.description(name) for name in figure_names}
+    new_figures = [name for name, description in descriptions.items() if description is None]
+    if not new_figures:
+        await working_page.acleanup()
     else:
-        working_page = Page(page, page_number, header_and_footer)
-    # This is the core part of the poop below that needs to be refactored
-    figures_on_page = working_page.extract_figure_names()
-    figures = []
-    for figure_name in figures_on_page:
-        # check if the figure has already been described in doc
-        if figure_name not in existing_figures:
-            if working_page.check_if_image_is_present(figure_name):
-                description = describe_image(
-                    working_page.page_image_uri + "/page.png",
-                    figure_name,
-                    working_page.page_text,
-                )
-                figure = Figures(
-                    figure_name=figure_name,
-                    page_number=page_number,
-                    figure_description=description,
-                )
-                figures.append(figure)
-                existing_figures.append(figure_name)  # Update the existing_figures list
+        cleanup = asyncio.ensure_future(working_page.acleanup())
+        try:
+            new_descriptions = await adescribe_figures(
+                {name: working_page.figure_image(name) for name in new_figures},
+                working_page.page_text,
+            )
+        except BaseException:
+            # only a failed description gives the figures up; the page is failing anyway
+            cleanup.cancel()
+            for name in new_figures:
+                figure_registry.release(name, page_number)
+            raise
+        # stored before the cleanup is awaited, so a cleanup failure doesn't cost a second vision call on retry
+        for name in new_figures:
+            figure_registry.record(name, page_number, new_descriptions[name])
+        descriptions.update(new_descriptions)
+        await cleanup
+    figures = [
+        Figures(figure_name=name, page_number=page_number, figure_description=descriptions[name])
+        for name in figure_names
+    ]
     working_page.set_figures(figures)
     combined_text = working_page.combine_cleaned_text_and_descriptions()
     final_text_to_write, _ = chunk_text(combined_text, 200, working_page.page_image_uri)
@@ -398,6 +632,85 @@ def make_page(
     return working_page.return_pydantic_page()
 
 
+def make_page(
+    figure_registry: FigureRegistry,
+    page,
+    page_number,
+    header_and_footer={"header": None, "footer": None},
+):
+    return run_sync(amake_page(figure_registry, page, page_number, header_and_footer))
+
+
+_speaker_latents = {}
+
+
+def get_speaker_latents(tts: TTS, speaker_location):
+    """Return the XTTS conditioning latents for a speaker file, computing them at most once.
+    Latents are keyed by the file's content hash, kept in memory for this process and
+    persisted under TTS_HOME/speakers/ so other workers can load them instead of re-extracting."""
+    speaker_hash = file_sha256(speaker_location)
+    if speaker_hash in _speaker_latents:
+        return _speaker_latents[speaker_hash]
+    model = tts.synthesizer.tts_model
+    speakers_dir = os.path.join(os.getenv("TTS_HOME", "outputs/models/"), "speakers")
+    cache_path = os.path.join(speakers_dir, speaker_hash + ".pt")
+    if os.path.exists(cache_path):
+        latents = torch.load(cache_path, map_location=model.device)
+    else:
+        gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
+            audio_path=[speaker_location]
+        )
+        latents = {
+            "gpt_cond_latent": gpt_cond_latent,
+            "speaker_embedding": speaker_embedding,
+        }
+        os.makedirs(speakers_dir, exist_ok=True)
+        # write then rename, so a concurrent worker never loads a half-written file
+        tmp_path = cache_path + ".{0}.tmp".format(os.getpid())
+        torch.save(latents, tmp_path)
+        os.replace(tmp_path, cache_path)
+    _speaker_latents[speaker_hash] = latents
+    return latents
+
+
+def synthesize_chunk(tts: TTS, text, latents, language="en"):
+    """Run XTTS inference for one chunk with precomputed speaker latents and return the waveform"""
+    config = tts.synthesizer.tts_config
+    output = tts.synthesizer.tts_model.inference(
+        text,
+        language,
+        latents["gpt_cond_latent"],
+        latents["speaker_embedding"],
+        temperature=config.temperature,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        top_k=config.top_k,
+        top_p=config.top_p,
+    )
+    return output["wav"]
+
+
+def synthesize_chunks(tts: TTS, chunks, latents, language="en"):
+    """Synthesize all chunks of a page and return their waveforms as arrays, in chunk order,
+    without writing any intermediate files. XTTS takes one text per inference call, so the
+    chunks run one after another under a single inference context."""
+    with torch.inference_mode():
+        return [synthesize_chunk(tts, chunk, latents, language) for chunk in chunks]
+
+
+def audio_cache_key(text, speaker_hash, language="en"):
+    """Cache key for one chunk's audio. Whitespace is normalized, so chunks that only differ
+    in line breaks or spacing share an entry."""
+    return DiskCache.key(
+        TTS_MODEL,
+        importlib.metadata.version("TTS"),
+        AUDIO_CACHE_VERSION,
+        speaker_hash,
+        language,
+        " ".join(text.split()),
+    )
+
+
 def make_page_reading(
     tts: TTS,
     page_text,
@@ -407,19 +720,287 @@ def make_page_reading(
 ):
     """This function literally makes the out-loud TTS readings of the page and saves the file
     tts: tts instance from setup_tts
+    Chunks already in the audio cache for this speaker are copied from it; only the rest are
+    synthesized, each distinct chunk once, and then added to the cache.
     """
-    for page_number, text_chunk in tqdm(enumerate(page_text)):
-        tts.tts_to_file(
-            text=text_chunk,
-            file_path=page_audio_uri + "/{0}.wav".format(page_number),
-            speaker_wav=speaker_location,
-            language="en",
-        )
-    path = concatenate_audio_pydub(page_audio_uri, "combined.wav")
+    latents = get_speaker_latents(tts, speaker_location)
+    speaker_hash = file_sha256(speaker_location)
+    keys = [audio_cache_key(chunk, speaker_hash) for chunk in page_text]
+    audio = {}
+    for key in set(keys):
+        cached = audio_cache.get(key)
+        if cached is not None:
+            audio[key] = cached
+    missing = {}
+    for key, chunk in zip(keys, page_text):
+        if key not in audio:
+            missing.setdefault(key, chunk)
+    waveforms = synthesize_chunks(tts, list(missing.values()), latents)
+    for key, wav in tqdm(zip(missing, waveforms)):
+        path = page_audio_uri + "/{0}.wav".format(keys.index(key))
+        tts.synthesizer.save_wav(wav=wav, path=path)
+        with open(path, "rb") as f:
+            audio[key] = f.read()
+        audio_cache.put(key, audio[key])
+    for chunk_number, key in enumerate(keys):
+        path = page_audio_uri + "/{0}.wav".format(chunk_number)
+        if key in missing and chunk_number == keys.index(key):
+            continue  # written by save_wav above
+        with open(path, "wb") as f:
+            f.write(audio[key])
+    # chunks left from an earlier, longer reading of the page would be concatenated too
+    for name in os.listdir(page_audio_uri):
+        stem, extension = os.path.splitext(name)
+        if extension == ".wav" and stem.isdigit() and int(stem) >= len(keys):
+            os.remove(os.path.join(page_audio_uri, name))
+    # chunks stay WAV; the page is encoded once, streaming, in OUTPUT_CODEC
+    path = concatenate_audio_pydub(page_audio_uri, audio_file_name("combined"))
     return path
 
 
-def load_chapters_from_yaml(file_path):
-    with open(file_path, "r") as file:
-        chapters_data = yaml.safe_load(file)
-    return [Chapter(**chapter_data) for chapter_data in chapters_data]
+class TTSWorker:
+    """Keeps one loaded TTS model for the life of a process or container and reads pages with it.
+    Model load time is tracked separately from synthesis time so reuse across a run can be measured."""
+
+    def __init__(
+        self,
+        speaker_location="speaker-longer-enhanced-90p.wav",
+        override_device=None,
+    ):
+        self.speaker_location = speaker_location
+        self.override_device = override_device
+        self.tts = None
+        self.load_seconds = 0.0
+        self.synth_seconds = 0.0
+        self.pages_read = 0
+        self.chars_read = 0
+        self.worker_id = "{0}-{1}".format(os.uname().nodename, os.getpid())
+
+    def load(self):
+        """Load the model on first use; later calls return the warm instance"""
+        if self.tts is None:
+            start = time.perf_counter()
+            self.tts = setup_tts(self.override_device)
+            self.load_seconds = time.perf_counter() - start
+            print(f"TTS worker ready in {self.load_seconds:.1f}s")
+        return self.tts
+
+    def read_page(self, final_text_list, page_audio_uri, page_number):
+        tts = self.load()
+        start = time.perf_counter()
+        path = make_page_reading(
+            tts,
+            final_text_list,
+            page_audio_uri,
+            page_number,
+            speaker_location=self.speaker_location,
+        )
+        self.synth_seconds += time.perf_counter() - start
+        self.pages_read += 1
+        self.chars_read += sum(len(chunk) for chunk in final_text_list)
+        return path
+
+    def stats(self):
+        """Load time and steady-state throughput, reported separately"""
+        return {
+            "worker_id": self.worker_id,
+            "load_seconds": self.load_seconds,
+            "synth_seconds": self.synth_seconds,
+            "pages_read": self.pages_read,
+            "chars_read": self.chars_read,
+            "pages_per_minute": (
+                60 * self.pages_read / self.synth_seconds if self.synth_seconds else 0.0
+            ),
+            "chars_per_second": (
+                self.chars_read / self.synth_seconds if self.synth_seconds else 0.0
+            ),
+            "audio_cache": audio_cache.stats(),
+        }
+
+
+_tts_worker = None
+
+
+def get_tts_worker(speaker_location="speaker-longer-enhanced-90p.wav"):
+    """Process-wide TTS worker, so every page handled by this process reuses one model"""
+    global _tts_worker
+    if _tts_worker is None:
+        _tts_worker = TTSWorker(speaker_location)
+    return _tts_worker
+
+
+def read_page_job(worker: TTSWorker, page_json, manifest: Manifest = None, catalog: Catalog = None):
+    """Read one page produced by make_page aloud and report where it went, with the worker's stats so far.
+    With a manifest, the page is marked read aloud for the fingerprint it was built from;
+    with a catalog, its audio is added to the index the server lists pages from."""
+    path = worker.read_page(
+        page_json["final_text_list"],
+        os.path.dirname(page_json["page_audio_uri"]),
+        page_json["page_number"],
+    )
+    if manifest is not None:
+        manifest.record(
+            page_json["page_number"], "read_aloud", page_json["fingerprint"], {"audio": path}
+        )
+    if catalog is not None:
+        catalog.record(page_json["page_number"], path, page_json.get("chapter_number"))
+    return {"page_number": page_json["page_number"], "path": path, "stats": worker.stats()}
+
+
+def read_page_aloud_local(
+    page_json, speaker_location="speaker-longer-enhanced-90p.wav", book_id=None
+):
+    """Process-pool entry point: read a page with this process's warm TTS worker"""
+    manifest = get_manifest(book_id) if book_id else None
+    return read_page_job(get_tts_worker(speaker_location), page_json, manifest, get_catalog())
+
+
+def load_extracted_page(page_number):
+    return ExtractedPage.load(get_outputs_dir(), page_number)
+
+
+def extract_document(doc_path, page_numbers, processes=None):
+    """Pre-pass over the PDF: render and extract every page in parallel, writing the artifacts
+    the later stages read instead of the PDF"""
+    return extract_pages(doc_path, page_numbers, get_outputs_dir(), processes)
+
+
+def find_running_lines(chapters):
+    """Detect repeated headers, footers and page numbers chapter by chapter, before any page is cleaned up.
+    Reads the extracted pages, so extract_document must have run first.
+    Returns {page_number: mask} for every page in the chapters."""
+    return extraction.find_running_lines(get_outputs_dir(), chapters)
+
+
+def prepare_document(doc_path, chapters, page_numbers, processes=None):
+    """The extract_pdf stage: extract every page, then return the running-line masks"""
+    extract_document(doc_path, page_numbers, processes)
+    return find_running_lines(chapters)
+
+
+def ensure_tts_model():
+    """The download_tts_model stage: fetch the model into TTS_HOME if it isn't there yet"""
+    setup_tts()
+    return True
+
+
+def warm_tts_worker(speaker_location):
+    """The download_tts_model stage for a process that reads pages itself: fetch the model and load it
+    into this process's TTS worker, so the first page doesn't pay for a second cold load"""
+    get_tts_worker(speaker_location).load()
+    return True
+
+
+def get_manifest(book_id):
+    return Manifest(os.path.join(get_outputs_dir(), "manifests", book_id))
+
+
+_figure_registries = {}
+
+
+def get_figure_registry(book_id):
+    """The book's FigureRegistry, one per process so pages built concurrently share what it has read"""
+    if book_id not in _figure_registries:
+        _figure_registries[book_id] = FigureRegistry(os.path.join(get_outputs_dir(), "figures", book_id))
+    return _figure_registries[book_id]
+
+
+def get_catalog():
+    return Catalog(os.path.join(get_outputs_dir(), "catalog"))
+
+
+def page_fingerprint(page, header_and_footer, speaker_location):
+    """Hashes of everything a page's outputs depend on, compared against the manifest to skip finished work.
+    page is a fitz page or its ExtractedPage artifact; both give the same pdf_page hash."""
+    return {
+        "pdf_page": page.pdf_page_hash if isinstance(page, ExtractedPage) else pdf_page_hash(page),
+        "header": header_and_footer["header"],
+        "footer": header_and_footer["footer"],
+        "strip_mask": json.dumps(header_and_footer.get("mask")),
+        "prompt_version": json.dumps(PROMPT_VERSIONS, sort_keys=True),
+        "speaker": file_sha256(speaker_location),
+        "codec": OUTPUT_CODEC,
+    }
+
+
+async def abuild_page_job(
+    manifest: Manifest,
+    figure_registry: FigureRegistry,
+    page: fitz.Page,
+    page_number,
+    header_and_footer,
+    speaker_location,
+    chapter_number=None,
+):
+    """Make the page unless the manifest shows it was already made from the same inputs.
+    The returned page dict carries its fingerprint, its chapter, and whether its audio is already up to date."""
+    fingerprint = page_fingerprint(page, header_and_footer, speaker_location)
+    if manifest.is_done(page_number, "extracted", fingerprint):
+        page_json = manifest.get(page_number)["page"]
+    else:
+        page_json = (
+            await amake_page(figure_registry, page, page_number, header_and_footer)
+        ).model_dump()
+        manifest.record(
+            page_number,
+            "extracted",
+            fingerprint,
+            {"image": page_json["page_image_uri"]},
+            page_json,
+        )
+    page_json["fingerprint"] = fingerprint
+    page_json["chapter_number"] = chapter_number
+    page_json["read_aloud"] = manifest.is_done(page_number, "read_aloud", fingerprint)
+    return page_json
+
+
+def build_page_job(
+    manifest: Manifest,
+    figure_registry: FigureRegistry,
+    page: fitz.Page,
+    page_number,
+    header_and_footer,
+    speaker_location,
+    chapter_number=None,
+):
+    return run_sync(
+        abuild_page_job(
+            manifest,
+            figure_registry,
+            page,
+            page_number,
+            header_and_footer,
+            speaker_location,
+            chapter_number,
+        )
+    )
+
+
+def page_job_inputs(chapters, page_number, strip_mask):
+    """What building a page takes from the working document: the page's header, footer and
+    running-line mask, and its chapter number.
+    Pages outside every chapter get no header/footer and no chapter, rather than failing."""
+    chapters = chapter_map(chapters or [])
+    chapter = chapters.chapter_for_page(page_number)
+    header_and_footer = dict(header_and_footer_for_page(chapters, page_number), mask=strip_mask)
+    return header_and_footer, chapter.chapter_number if chapter else None
+
+
+def make_page_from_artifact(
+    page_number,
+    chapters,
+    strip_mask,
+    book_id,
+    speaker_location="speaker-longer-enhanced-90p.wav",
+):
+    """Process-pool entry point: build one extracted page and return it as a dict"""
+    header_and_footer, chapter_number = page_job_inputs(chapters, page_number, strip_mask)
+    return build_page_job(
+        get_manifest(book_id),
+        get_figure_registry(book_id),
+        load_extracted_page(page_number),
+        page_number,
+        header_and_footer,
+        speaker_location,
+        chapter_number,
+    )
@@ -0,0 +1,143 @@
+"""Execution backends for pipeline.convert_book. A backend runs the pipeline's stages, download_tts_model,
+extract_pdf, make_page and read_page_aloud, and holds the working document the page builders share.
+convert.py has the Modal backend; LocalBackend runs the same stages on this machine's process pools with
+a local outputs directory, so the pipeline can be profiled on CPU machines and in CI without Modal.
+Nothing here imports the TTS/ML stack: the pool processes import audiobook themselves."""
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from extraction import extract_pages, find_running_lines
+
+
+class InMemoryDict:
+    """Working document for a single local run"""
+
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    async def put(self, key, value):
+        self.values[key] = value
+
+
+class SQLiteDict:
+    """Working document kept in a SQLite file, so it survives the run and can be shared by processes
+    on the same machine. Values are pickled."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB)")
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    async def get(self, key, default=None):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    async def put(self, key, value):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value) VALUES (?, ?)", (key, pickle.dumps(value))
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class ModalDict:
+    """The working document interface over a modal.Dict"""
+
+    def __init__(self, modal_dict):
+        self.modal_dict = modal_dict
+
+    async def get(self, key, default=None):
+        value = await self.modal_dict.get.aio(key)
+        return default if value is None else value
+
+    async def put(self, key, value):
+        await self.modal_dict.put.aio(key, value)
+
+
+def use_outputs_dir(outputs_dir):
+    """Pool initializer: point audiobook at the backend's outputs directory before the first task"""
+    import audiobook
+
+    audiobook.use_outputs_dir(outputs_dir)
+
+
+def call_audiobook(function_name, *args):
+    """Process-pool entry point: run an audiobook function by name, so only the pool processes
+    import audiobook and load the TTS/ML stack"""
+    import audiobook
+
+    return getattr(audiobook, function_name)(*args)
+
+
+class LocalBackend:
+    """Runs every stage on local process pools: page building on concurrency processes, and TTS
+    on tts_concurrency processes that each load the model once. Outputs go to outputs_dir, which
+    each pool process is given as it starts; the caller's environment isn't touched.
+    Use it as a context manager so the pools are shut down."""
+
+    def __init__(
+        self,
+        outputs_dir="outputs",
+        working_doc=None,
+        concurrency=4,
+        tts_concurrency=1,
+        speaker_location="mount/speaker-longer-enhanced-90p.wav",
+    ):
+        self.outputs_dir = outputs_dir
+        self.working_doc = InMemoryDict() if working_doc is None else working_doc
+        self.concurrency = concurrency
+        self.speaker_location = speaker_location
+        self.extract_pool = ProcessPoolExecutor(concurrency, initializer=use_outputs_dir, initargs=(outputs_dir,))
+        self.tts_pool = ProcessPoolExecutor(tts_concurrency, initializer=use_outputs_dir, initargs=(outputs_dir,))
+
+    async def _run(self, pool, function_name, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, call_audiobook, function_name, *args)
+
+    async def download_tts_model(self):
+        return await self._run(self.tts_pool, "warm_tts_worker", self.speaker_location)
+
+    async def extract_pdf(self, doc_path, chapters, page_numbers):
+        # Run from this process on a pool of concurrency processes. No page has been built yet, so the
+        # extract pool hasn't started its processes and no more than concurrency extract at once.
+        return await asyncio.to_thread(self._prepare_document, doc_path, chapters, page_numbers)
+
+    def _prepare_document(self, doc_path, chapters, page_numbers):
+        extract_pages(doc_path, page_numbers, self.outputs_dir, self.concurrency)
+        return find_running_lines(self.outputs_dir, chapters)
+
+    async def make_page(self, doc_path, page_number, book_id, strip_mask):
+        chapters = await self.working_doc.get("chapters")
+        return await self._run(
+            self.extract_pool,
+            "make_page_from_artifact",
+            page_number,
+            chapters,
+            strip_mask,
+            book_id,
+            self.speaker_location,
+        )
+
+    async def read_page_aloud(self, page_json, book_id):
+        return await self._run(self.tts_pool, "read_page_aloud_local", page_json, self.speaker_location, book_id)
+
+    def close(self):
+        self.extract_pool.shutdown()
+        self.tts_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,74 @@
+"""Micro-benchmarks for the text and audio paths. Run with: python benchmarks.py [name ...]"""
+import subprocess
+import sys
+import timeit
+from chunking import chunk_text
+
+SAMPLE = (
+    "In Figure 3.2 the estimate is 0.95, i.e. close to one. Dr. Smith et al. disagree, "
+    "arguing the sample of 1,204 pages is too small! Is it? The answer depends on the prior. "
+)
+
+
+def legacy_chunk_text(text, max_length):
+    """The previous word-at-a-time chunker, kept for comparison"""
+    chunks = []
+    current_chunk = []
+    for sentence in text.split("."):
+        for word in sentence.split():
+            if len(" ".join(current_chunk + [word])) > max_length:
+                chunks.append(" ".join(current_chunk))
+                current_chunk = [word]
+            else:
+                current_chunk.append(word)
+        if current_chunk:
+            chunks.append(" ".join(current_chunk))
+            current_chunk = []
+    return chunks
+
+
+def bench_chunk_text():
+    page = SAMPLE * 15  # roughly one page of a book
+    book = page * 400
+    # OCR output without sentence breaks, where the word-at-a-time join is quadratic in chunk length
+    run_on = page.replace(".", ",") * 40
+    for label, text, number in [("page", page, 200), ("book", book, 1), ("run-on", run_on, 1)]:
+        for max_length in (200, 2000):
+            new = timeit.timeit(lambda: chunk_text(text, max_length, None), number=number) / number
+            old = timeit.timeit(lambda: legacy_chunk_text(text, max_length), number=number) / number
+            new_chunks = len(chunk_text(text, max_length, None)[0])
+            old_chunks = len(legacy_chunk_text(text, max_length))
+            print(f"chunk_text {label} ({len(text)} chars, max {max_length}): "
+                  f"{new * 1000:.2f}ms, {new_chunks} chunks | legacy {old * 1000:.2f}ms, {old_chunks} chunks")
+
+
+# Modules the download client and server-side tooling import; none of them should pull in the ML stack
+LIGHT_MODULES = ["audio", "chapters", "chunking", "cache", "manifest", "pipeline", "figures", "llm_client", "text_quality", "layout", "extraction", "export", "downloads", "catalog", "archives", "backends", "figure_registry"]
+
+
+def import_seconds(statement):
+    """Wall time of a fresh interpreter running statement, so nothing is already imported"""
+    start = timeit.default_timer()
+    subprocess.run([sys.executable, "-c", statement], check=True, capture_output=True)
+    return timeit.default_timer() - start
+
+
+def bench_import_time():
+    baseline = min(import_seconds("pass") for _ in range(3))
+    for module in LIGHT_MODULES + ["api", "audiobook"]:
+        try:
+            seconds = min(import_seconds(f"import {module}") for _ in range(3))
+        except subprocess.CalledProcessError:
+            print(f"import {module}: failed (missing dependencies?)")
+            continue
+        print(f"import {module}: {(seconds - baseline) * 1000:.0f}ms over interpreter start")
+
+
+BENCHMARKS = {
+    "chunk_text": bench_chunk_text,
+    "import_time": bench_import_time,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
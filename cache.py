@@ -0,0 +1,142 @@
+import hashlib
+import os
+
+
+def file_sha256(path):
+    """Hash a file's content in blocks, so large reference WAVs are never read into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def saved_file_sha256(path):
+    """file_sha256, saved next to the file as <path>.sha256 and reused until its size or mtime changes"""
+    stat = os.stat(path)
+    stamp = "{0} {1}".format(stat.st_size, stat.st_mtime_ns)
+    digest_path = path + ".sha256"
+    try:
+        with open(digest_path, "r") as f:
+            saved_stamp, digest = f.read().rsplit(" ", 1)
+        if saved_stamp == stamp:
+            return digest
+    except (FileNotFoundError, ValueError):
+        pass
+    digest = file_sha256(path)
+    tmp_path = digest_path + ".{0}.tmp".format(os.getpid())
+    with open(tmp_path, "w") as f:
+        f.write(stamp + " " + digest)
+    os.replace(tmp_path, digest_path)
+    return digest
+
+
+class DiskCache:
+    """Content-addressed cache of byte values stored as files under one directory.
+    Keys are hashes of everything that determines the value, so changed inputs simply miss.
+    Reads refresh an entry's mtime, and once the cache grows past max_bytes the least
+    recently used entries are evicted first, down to low_water of max_bytes, so a full cache
+    isn't rescanned on every put."""
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, low_water=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+
+    @staticmethod
+    def key(*parts):
+        """Hash the parts (str, bytes, numbers or None) into a cache key"""
+        digest = hashlib.sha256()
+        for part in parts:
+            if part is None:
+                # no length prefix, so None can't collide with "" or any other part
+                digest.update(b"None;")
+                continue
+            if not isinstance(part, bytes):
+                part = str(part).encode("utf-8")
+            # length prefix so ("ab", "c") and ("a", "bc") don't collide
+            digest.update(str(len(part)).encode("ascii") + b":" + part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so a concurrent reader never sees a partial entry
+        tmp_path = path + ".{0}.tmp".format(os.getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += len(value)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for shard in os.listdir(self.directory):
+            shard_path = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(shard_path, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(shard_path, name)))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache is down to low_water of max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,122 @@
+import json
+import os
+import socket
+import time
+from audio import audio_duration, codec_for_path
+from cache import saved_file_sha256
+
+
+class Catalog:
+    """Index of the finished page audio, kept as JSONL files in one directory so listing the outputs
+    is a few small reads instead of a stat per page on the network filesystem.
+    Appends from different containers aren't atomic on the network filesystem, so every process
+    appends only to its own file, <host>-<pid>.jsonl, and readers merge the files; the newest record
+    for a page wins. Each record starts on a fresh line, so one torn by a dying writer only loses
+    itself. Readers keep their position in each file and only parse what was appended."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.writer_path = os.path.join(directory, "{0}-{1}.jsonl".format(socket.gethostname(), os.getpid()))
+        self._positions = {}  # file name: (inode, offset read up to)
+        self._records = {}  # page number: newest record, deletions included
+
+    def _append(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        record["recorded_at"] = time.time()
+        # the leading newline ends a record torn by an earlier writer, so this one isn't merged into it
+        line = ("\n" + json.dumps(record) + "\n").encode("utf-8")
+        fd = os.open(self.writer_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def record(self, page_number, path, chapter_number=None):
+        """Add or replace the page's entry, with the size, duration, codec, digest and mtime of path"""
+        stat = os.stat(path)
+        entry = {
+            "page_number": page_number,
+            "chapter_number": chapter_number,
+            "path": path,
+            "size": stat.st_size,
+            "duration": audio_duration(path),
+            "codec": codec_for_path(path),
+            "sha256": saved_file_sha256(path),
+            "mtime": stat.st_mtime,
+        }
+        self._append(entry)
+        return entry
+
+    def remove(self, page_number):
+        self._append({"page_number": page_number, "deleted": True})
+
+    def _files(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return {}
+        files = {}
+        for name in names:
+            if name.endswith(".jsonl"):
+                try:
+                    files[name] = os.stat(os.path.join(self.directory, name)).st_ino
+                except FileNotFoundError:
+                    pass  # removed by a compaction since the listing
+        return files
+
+    def entries(self):
+        """{page number: entry} for every page currently in the catalog"""
+        files = self._files()
+        if any(name not in files or files[name] != inode for name, (inode, _) in self._positions.items()):
+            # a file was compacted away or replaced since the last read: start over
+            self._positions = {}
+            self._records = {}
+        for name, inode in files.items():
+            offset = self._positions.get(name, (inode, 0))[1]
+            with open(os.path.join(self.directory, name), "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            # a last line without its newline is still being appended
+            complete = data[: data.rfind(b"\n") + 1]
+            self._positions[name] = (inode, offset + len(complete))
+            for line in complete.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn by a writer that died mid-record
+                current = self._records.get(record["page_number"])
+                if current is None or record.get("recorded_at", 0) >= current.get("recorded_at", 0):
+                    self._records[record["page_number"]] = record
+        return {page_number: record for page_number, record in self._records.items() if not record.get("deleted")}
+
+    def list(self, chapter_number=None, modified_since=None, offset=0, limit=100):
+        """Entries in page order, filtered by chapter and by mtime, one page of results at a time.
+        Returns (entries, total number of matching entries)."""
+        matching = [
+            entry
+            for _, entry in sorted(self.entries().items())
+            if (chapter_number is None or entry["chapter_number"] == chapter_number)
+            and (modified_since is None or entry["mtime"] > modified_since)
+        ]
+        return matching[offset : offset + limit], len(matching)
+
+    def compact(self):
+        """Merge every file into compacted.jsonl with only the current entry for each page.
+        Records appended while this runs would be lost, so only compact when no pages are being read."""
+        entries = self.entries()
+        merged = set(self._positions)
+        compacted_path = os.path.join(self.directory, "compacted.jsonl")
+        tmp_path = compacted_path + ".{0}.tmp".format(os.getpid())
+        with open(tmp_path, "w") as f:
+            for _, entry in sorted(entries.items()):
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, compacted_path)
+        for name in merged - {"compacted.jsonl"}:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        self._positions = {}
+        self._records = {}
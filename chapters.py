@@ -0,0 +1,90 @@
+from bisect import bisect_right
+import yaml
+from pydantic import BaseModel
+
+
+class Chapter(BaseModel):
+    chapter_number: int
+    chapter_title_header: str
+    chapter_title_footer: str
+    chapter_start_page: int
+    chapter_end_page: int
+
+
+class ChapterMap:
+    """The book's chapters, sorted by start page and checked for overlapping ranges, with a
+    bisect lookup of the chapter a page belongs to. Iterates and indexes like the chapter list."""
+
+    def __init__(self, chapters):
+        self.chapters = sorted(chapters, key=lambda chapter: chapter.chapter_start_page)
+        for chapter in self.chapters:
+            if chapter.chapter_start_page > chapter.chapter_end_page:
+                raise ValueError(
+                    f"Chapter {chapter.chapter_number} starts on page {chapter.chapter_start_page}, "
+                    f"after its end page {chapter.chapter_end_page}"
+                )
+        for previous, chapter in zip(self.chapters, self.chapters[1:]):
+            if chapter.chapter_start_page <= previous.chapter_end_page:
+                raise ValueError(
+                    f"Chapter {chapter.chapter_number} (pages {chapter.chapter_start_page}-{chapter.chapter_end_page}) "
+                    f"overlaps chapter {previous.chapter_number} "
+                    f"(pages {previous.chapter_start_page}-{previous.chapter_end_page})"
+                )
+        self._starts = [chapter.chapter_start_page for chapter in self.chapters]
+
+    def __iter__(self):
+        return iter(self.chapters)
+
+    def __len__(self):
+        return len(self.chapters)
+
+    def __getitem__(self, index):
+        return self.chapters[index]
+
+    def chapter_for_page(self, page_number):
+        """The chapter whose page range holds page_number, or None"""
+        i = bisect_right(self._starts, page_number) - 1
+        if i >= 0 and page_number <= self.chapters[i].chapter_end_page:
+            return self.chapters[i]
+        return None
+
+    def in_scope(self, page_number):
+        return self.chapter_for_page(page_number) is not None
+
+    def page_numbers(self):
+        """Every page in a chapter, in order"""
+        return [
+            page_number
+            for chapter in self.chapters
+            for page_number in range(chapter.chapter_start_page, chapter.chapter_end_page + 1)
+        ]
+
+
+def chapter_map(chapters):
+    return chapters if isinstance(chapters, ChapterMap) else ChapterMap(chapters)
+
+
+def chapter_for_page(chapters, page_number):
+    """The chapter whose page range holds page_number, or None"""
+    return chapter_map(chapters).chapter_for_page(page_number)
+
+
+def header_and_footer_for_page(chapters, page_number):
+    """The header and footer to strip from a page, taken from the chapter it belongs to.
+    A page outside every chapter has neither."""
+    current_chapter = chapter_for_page(chapters, page_number)
+
+    header_and_footer = {"header": None, "footer": None}
+    if current_chapter is None:
+        return header_and_footer
+    if current_chapter.chapter_title_header != "":
+        header_and_footer["header"] = current_chapter.chapter_title_header
+    if current_chapter.chapter_title_footer != "":
+        header_and_footer["footer"] = current_chapter.chapter_title_footer
+    return header_and_footer
+
+
+def load_chapters_from_yaml(file_path):
+    with open(file_path, "r") as file:
+        chapters_data = yaml.safe_load(file)
+    return ChapterMap(Chapter(**chapter_data) for chapter_data in chapters_data)
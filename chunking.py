@@ -0,0 +1,91 @@
+import re
+
+# Words that end in a period without ending the sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "cf",
+    "al", "fig", "figs", "eq", "eqs", "vol", "ch", "sec", "pp", "approx", "inc", "ltd",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+
+
+def split_sentences(text):
+    """Split text into sentences on ., ! and ? followed by whitespace.
+    Decimals like 3.14 and Figure 1.2 never split because no whitespace follows the period;
+    abbreviations and single-letter initials (Dr., e.g., J. Smith) don't end a sentence."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        # walk back over just the last word, so the scan stays linear in the text
+        word_start = match.start()
+        while word_start > start and not text[word_start - 1].isspace():
+            word_start -= 1
+        last_word = text[word_start : match.start()].lstrip("\"'([").lower()
+        if text[match.start()] == "." and (
+            last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha())
+        ):
+            continue
+        sentences.append(text[start : match.end()])
+        start = match.end()
+    sentences.append(text[start:])
+    return [" ".join(sentence.split()) for sentence in sentences if sentence.strip()]
+
+
+def split_long_sentence(sentence, max_length):
+    """Split one sentence longer than max_length on word boundaries, hard-splitting only single words that don't fit"""
+    pieces = []
+    current = []
+    current_length = 0
+    for word in sentence.split(" "):
+        while len(word) > max_length:
+            if current:
+                pieces.append(" ".join(current))
+                current, current_length = [], 0
+            pieces.append(word[:max_length])
+            word = word[max_length:]
+        added = len(word) + (1 if current else 0)
+        if current and current_length + added > max_length:
+            pieces.append(" ".join(current))
+            current, current_length = [], 0
+            added = len(word)
+        if word:
+            current.append(word)
+            current_length += added
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_text(
+    text, max_length, page_image, described_figures=None, handle_figures=False
+):
+    """Pack whole sentences into chunks of at most max_length characters, in one linear pass.
+    A sentence longer than max_length is split on word boundaries."""
+    if described_figures is None:
+        described_figures = set()
+
+    chunks = []
+    current_chunk = []
+    current_length = 0
+
+    for sentence in split_sentences(text):
+        if len(sentence) > max_length:
+            pieces = split_long_sentence(sentence, max_length)
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            # running length, plus a joining space if the chunk already has text
+            added = len(piece) + (1 if current_chunk else 0)
+            if current_chunk and current_length + added > max_length:
+                chunks.append(" ".join(current_chunk))
+                current_chunk = []
+                current_length = 0
+                added = len(piece)
+            current_chunk.append(piece)
+            current_length += added
+
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+
+    described_figures = set()
+    return chunks, described_figures
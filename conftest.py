@@ -0,0 +1,49 @@
+"""Test helpers shared by the figure, layout and extraction tests"""
+
+
+class FakePixmap:
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(b"png")
+
+    def tobytes(self, output, jpg_quality=80):
+        return b"jpeg"
+
+
+class FakePage:
+    """Just enough of a PyMuPDF page to detect figures and running lines and to extract"""
+
+    rect = (0, 0, 600, 800)
+
+    def __init__(self, blocks, images=(), drawings=(), contents=b"q 1 0 0 1 0 0 cm Q"):
+        self.blocks = blocks
+        self.images = images
+        self.drawings = drawings
+        self.contents = contents
+        self.renders = 0
+
+    def read_contents(self):
+        return self.contents
+
+    def get_text(self, option="text"):
+        if option == "dict":
+            return {"blocks": self.blocks}
+        return "".join(span["text"] + "\n" for block in self.blocks if block["type"] == 0
+                       for line in block["lines"] for span in line["spans"])
+
+    def get_pixmap(self, **kwargs):
+        self.renders += 1
+        return FakePixmap()
+
+    def get_images(self, full=False):
+        return [(xref,) for xref, _ in self.images]
+
+    def get_image_rects(self, xref):
+        return [rect for image_xref, rect in self.images if image_xref == xref]
+
+    def get_drawings(self):
+        return [{"rect": rect} for rect in self.drawings]
+
+
+def text_block(bbox, text):
+    return {"type": 0, "bbox": bbox, "lines": [{"bbox": bbox, "spans": [{"text": text}]}]}
@@ -1,7 +1,12 @@
 import asyncio
-import fitz
+import os
 import modal
-from audiobook import setup_tts, make_page_reading, Chapter, PydanticPage, load_chapters_from_yaml, make_page
+from audiobook import (ensure_tts_model, TTSWorker, Chapter, load_chapters_from_yaml, abuild_page_job, read_page_job,
+                       get_manifest, get_figure_registry, get_catalog, file_sha256, prepare_document,
+                       load_extracted_page, page_job_inputs)
+from audio import OUTPUT_CODEC
+from backends import LocalBackend, ModalDict
+from pipeline import convert_book
 
 # Initialize the modal stub and configure the container image
 stub = modal.Stub(name="audiobook")
@@ -12,91 +17,107 @@ image = (
     .debian_slim()
     .apt_install("ffmpeg")
     .pip_install(["pymupdf", "TTS", "torch", "litellm", "pydub", "tqdm", "pydantic==2.5.2"])
+    # the containers encode with the codec chosen where the app is launched
+    .env({"AUDIOBOOK_CODEC": OUTPUT_CODEC})
 )
-mounts = [modal.Mount.from_local_dir("/Users/max/Documents/rethink-stats/audiobook/mount",
-                                      remote_path="/mount")]
+SPEAKER_LOCATION = "/mount/speaker-longer-enhanced-90p.wav"
+# mount/ next to this file unless AUDIOBOOK_MOUNT points elsewhere
+MOUNT_DIR = os.getenv("AUDIOBOOK_MOUNT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mount"))
+mounts = [modal.Mount.from_local_dir(MOUNT_DIR, remote_path="/mount")]
 volume = modal.NetworkFileSystem.persisted("job-storage-vol")
 
 # Function to download the TTS model to the container
 @stub.function(network_file_systems={"/outputs": volume}, image=image, mounts=mounts)
 def download_tts_model():
-    setup_tts()
-    return True
+    return ensure_tts_model()
 
-# Asynchronous function to process each page and generate audio
-@stub.function(gpu="any", network_file_systems={"/outputs": volume}, 
-               image=image,
-               mounts=mounts, 
-               secret=modal.Secret.from_name("OPENAI_API_KEY"), 
-               timeout=1800)
-async def read_page_aloud(page_json):
-    '''Get the current working document from the working_doc_dict, process the indicated page,
-    and update the working_doc_dict with the new pages and figures'''
-    # Initialize TTS and open the document
-    tts = setup_tts()
+# Persistent TTS worker: the model is loaded once per container, then reused for every page it is sent
+@stub.cls(gpu="any", network_file_systems={"/outputs": volume},
+          image=image,
+          mounts=mounts,
+          secret=modal.Secret.from_name("OPENAI_API_KEY"),
+          timeout=1800)
+class PageReader:
+    def __enter__(self):
+        self.worker = TTSWorker(speaker_location=SPEAKER_LOCATION)
+        self.worker.load()
+
+    @modal.method()
+    def read_page_aloud(self, page_json, book_id):
+        '''Generate the audio for one processed page and return where it was written,
+        along with the worker's load time and throughput so far'''
+        return read_page_job(self.worker, page_json, get_manifest(book_id), get_catalog())
 
-    # Process the page and generate audio
-    page = make_page_reading(tts, page_json['page_text'], page_json['page_audio_uri'], page_json['page_number'], page_json['header_and_footer'], speaker_location="/mount/speaker-longer-enhanced-90p.wav")
 
-async def make_pages(doc_path_local, page_number):
+# Page building is mostly waiting on the LLM, so each container takes several pages at once;
+# they share one rate-limited client
+@stub.function(network_file_systems={"/outputs": volume},
+               image=image,
+               mounts=mounts,
+               secret=modal.Secret.from_name("OPENAI_API_KEY"),
+               timeout=1800,
+               allow_concurrent_inputs=8)
+async def make_pages(doc_path_local, page_number, book_id, strip_mask):
     '''Get the current working document from the working_doc_dict, process the indicated page,
-    and update the working_doc_dict with the new pages and figures'''
-    figures = await stub.working_doc_dict.get.aio("figures")
+    and return it as a dict ready to be read aloud. Pages the run manifest shows are
+    already built from the same inputs are returned without being processed again.'''
     chapters = await stub.working_doc_dict.get.aio("chapters")
-    doc = fitz.open("/" + doc_path_local)
-    page = doc[page_number]
-    existing_figure_names = []
+    # extract_pdf already rendered and extracted the page to /outputs; the PDF isn't opened again
+    page = load_extracted_page(page_number)
+    header_and_footer, chapter_number = page_job_inputs(chapters, page_number, strip_mask)
+    # figures are claimed and described through the registry on /outputs, not the working document
+    return await abuild_page_job(get_manifest(book_id), get_figure_registry(book_id), page, page_number,
+                                 header_and_footer, SPEAKER_LOCATION, chapter_number)
 
-    if figures is None:
-        figures = []
-    else:
-        get_figure_names = lambda figure: figure.figure_name
-        existing_figure_names = list(map(get_figure_names, figures))
-    
-    if chapters is None:
-        chapters = []
 
-    current_chapter = None
-    for chapter in chapters:
-        if chapter.chapter_start_page <= page_number <= chapter.chapter_end_page:
-            current_chapter = chapter
-            break
-    
-    header_and_footer = {'header': None, 'footer': None}
-    if current_chapter.chapter_title_header != "":
-        header_and_footer['header'] = current_chapter.chapter_title_header
-    if current_chapter.chapter_title_footer != "":
-        header_and_footer['footer'] = current_chapter.chapter_title_footer
-    make_page(existing_figure_names, page, page_number, header_and_footer)
+# Render and extract every page on one many-core container before any page reaches the LLM,
+# then find running headers, footers and page numbers across each chapter
+@stub.function(network_file_systems={"/outputs": volume}, image=image, mounts=mounts, cpu=8, timeout=1800)
+def extract_pdf(doc_path_local, chapters, page_numbers):
+    return prepare_document("/" + doc_path_local, chapters, page_numbers)
+
+
+class ModalBackend:
+    """Runs each stage as a Modal function on the /outputs volume, with the working document in
+    working_doc_dict; see backends.py for the local equivalent"""
+
+    def __init__(self):
+        self.working_doc = ModalDict(stub.working_doc_dict)
+        self.reader = PageReader()
+
+    async def download_tts_model(self):
+        return await download_tts_model.remote.aio()
+
+    async def extract_pdf(self, doc_path, chapters, page_numbers):
+        return await extract_pdf.remote.aio(doc_path, chapters, page_numbers)
+
+    async def make_page(self, doc_path, page_number, book_id, strip_mask):
+        return await make_pages.remote.aio(doc_path, page_number, book_id, strip_mask)
+
+    async def read_page_aloud(self, page_json, book_id):
+        return await self.reader.read_page_aloud.remote.aio(page_json, book_id)
 
 
 # Main entry point for local execution
-async def main_thread():
+async def main_thread(concurrency=16, tts_concurrency=4, retries=2, offline=False):
     doc_path_local = "mount/book.pdf"
+    # The run manifest lives under /outputs/manifests/<book_id>/, so a re-run only redoes changed or unfinished pages
+    book_id = file_sha256(doc_path_local)[:16]
 
-    # Download TTS model asynchronously
-    await download_tts_model.remote.aio()
-    print("TTS model downloaded")
-
-    # Load chapters and initialize working_doc as a distributed dict
+    # Load chapters, sorted and checked for overlapping page ranges
     chapters = load_chapters_from_yaml('chapters.yaml')
     # check that chapters are valid Chapter objects
     for chapter in chapters:
         assert isinstance(chapter, Chapter)
-    await stub.working_doc_dict.put.aio("chapters", chapters)
-    await stub.working_doc_dict.put.aio("figures", [])
-
-    for chapter in chapters:
-        page_start = chapter.chapter_start_page
-        page_end = chapter.chapter_end_page
-        for page_number in range(page_start, page_end + 1):
-            make_pages(doc_path_local, page_number)
-        # Process each page asynchronously
-        # tasks = [read_page_aloud.remote.aio(doc_path_local, page_number)
-        #         for page_number in range(page_start, page_end + 1)]
 
-    await asyncio.gather(*tasks)
+    if offline:
+        # Same pipeline on local process pools; each TTS process loads the model once
+        with LocalBackend(concurrency=concurrency, tts_concurrency=tts_concurrency) as backend:
+            await convert_book(backend, doc_path_local, chapters, book_id, concurrency, tts_concurrency, retries)
+    else:
+        # Pages fan out to Modal; TTS for finished pages overlaps with extraction of the rest
+        await convert_book(ModalBackend(), doc_path_local, chapters, book_id, concurrency, tts_concurrency, retries)
 
 @stub.local_entrypoint()
-def main():
-    asyncio.run(main_thread())
+def main(concurrency: int = 16, tts_concurrency: int = 4, retries: int = 2, offline: bool = False):
+    asyncio.run(main_thread(concurrency, tts_concurrency, retries, offline))
@@ -0,0 +1,150 @@
+"""Parallel, resumable file downloads for the api.py client, and the Range parsing the server uses to serve them.
+requests is only imported when a Downloader makes its own session."""
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from archives import unpack_tar
+from cache import file_sha256
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """(start, end) byte offsets, end inclusive, requested by a single-range Range header.
+    None when there is no usable header, or the range ends before it starts, so the whole file
+    is sent; raises ValueError when the range can't be satisfied: it starts past the end of the
+    file or asks for the last zero bytes."""
+    match = RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":  # suffix range: the last <end> bytes
+        if int(end) == 0 or size == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - int(end)), size - 1
+    if end and int(end) < int(start):
+        return None  # syntactically invalid, so the header is ignored
+    if int(start) >= size:
+        raise ValueError("range starts past the end of the file")
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+def iter_file_range(path, start, end, block_size=1 << 20):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Downloader:
+    """Downloads files over one pooled HTTP session with several worker threads.
+    Each file streams to <path>.part in chunks; an interrupted download resumes from the
+    partial file with a Range request, and the finished file is checked against the expected
+    size and SHA-256 before it is moved into place."""
+
+    def __init__(self, workers=8, chunk_size=1 << 20, retries=3, timeout=60, session=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            # one kept-alive connection per worker
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self.bytes_downloaded = 0
+        self.resumed = 0
+
+    def fetch(self, url, path, size=None, sha256=None):
+        """Download url to path, resuming a partial download, and return path.
+        A file already at path with the expected size and SHA-256 isn't downloaded again."""
+        if sha256 and os.path.exists(path) and size in (None, os.path.getsize(path)) and file_sha256(path) == sha256:
+            return path
+        partial_path = path + ".part"
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        if size is not None and offset > size:
+            offset = 0
+        digest = hashlib.sha256()
+        headers = {"Range": "bytes={0}-".format(offset)} if offset else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 206:
+                self.resumed += 1
+                with open(partial_path, "rb") as f:
+                    for block in iter(lambda: f.read(self.chunk_size), b""):
+                        digest.update(block)
+                mode = "ab"
+            elif response.status_code == 200:
+                mode = "wb"  # no range requested, or the server ignored it
+            elif response.status_code == 416 and offset:
+                # the partial file is already complete; checked below
+                with open(partial_path, "rb") as f:
+                    for block in iter(lambda: f.read(self.chunk_size), b""):
+                        digest.update(block)
+                mode = None
+            else:
+                raise DownloadError("{0}: HTTP {1}".format(url, response.status_code))
+            if mode:
+                with open(partial_path, mode) as f:
+                    for chunk in response.iter_content(self.chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        self.bytes_downloaded += len(chunk)
+            expected_sha256 = sha256 or response.headers.get("X-Content-SHA256")
+        received = os.path.getsize(partial_path)
+        if size is not None and received != size:
+            if received > size:
+                os.remove(partial_path)  # can't be resumed into the right file
+            raise DownloadError("{0}: expected {1} bytes, got {2}".format(url, size, received))
+        if expected_sha256 and digest.hexdigest() != expected_sha256:
+            os.remove(partial_path)  # corrupt, so don't resume from it
+            raise DownloadError("{0}: checksum does not match".format(url))
+        os.replace(partial_path, path)
+        return path
+
+    def fetch_archive(self, url, directory, params=None):
+        """Stream a tar of many files from url and unpack each one into directory as it arrives.
+        Returns the paths written; files finished before a dropped connection are kept."""
+        with self.session.get(url, params=params, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise DownloadError("{0}: HTTP {1}".format(url, response.status_code))
+            response.raw.decode_content = True
+            return unpack_tar(response.raw, directory, self.chunk_size)
+
+    def fetch_with_retries(self, url, path, size=None, sha256=None):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.fetch(url, path, size, sha256)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                # the next attempt resumes from whatever reached the partial file
+                time.sleep(min(30, 2**attempt))
+
+    def fetch_all(self, downloads):
+        """Download (url, path, size, sha256) tuples in parallel.
+        Returns {path: exception} for the downloads that still failed after retrying."""
+        failures = {}
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = {executor.submit(self.fetch_with_retries, *download): download[1] for download in downloads}
+            for future, path in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failures[path] = e
+        return failures
@@ -0,0 +1,121 @@
+"""Exports downloaded page audio as an audiobook: one file with chapter markers, or one file per chapter.
+Pages are assigned to chapters by the chapters' page ranges, and every page is read once, in order."""
+import os
+import subprocess
+from audio import EXTENSIONS, audio_file_name, iter_pcm, open_encoder, pcm_params
+
+
+def page_audio_paths(directory):
+    """{page number: path} for the numbered audio files in directory (12.opus, 13.wav, ...)"""
+    paths = {}
+    for name in os.listdir(directory):
+        stem, extension = os.path.splitext(name)
+        if stem.isdigit() and extension in EXTENSIONS:
+            paths[int(stem)] = os.path.join(directory, name)
+    return paths
+
+
+def chapter_title(chapter):
+    return chapter.chapter_title_header.strip() or "Chapter {0}".format(chapter.chapter_number)
+
+
+def chapter_page_audio(chapters, page_audio):
+    """[(chapter, [page audio path, ...]), ...] in chapter order, taken from each chapter's page range.
+    Pages without audio are reported and left out."""
+    assigned = []
+    missing = []
+    for chapter in sorted(chapters, key=lambda chapter: chapter.chapter_start_page):
+        paths = []
+        for page_number in range(chapter.chapter_start_page, chapter.chapter_end_page + 1):
+            if page_number in page_audio:
+                paths.append(page_audio[page_number])
+            else:
+                missing.append(page_number)
+        assigned.append((chapter, paths))
+    if missing:
+        print(f"No audio for pages {missing}; they are left out of the export")
+    return assigned
+
+
+def stream_pages(output, paths, params, block_frames=65536):
+    """Write each page's PCM to output in order and return the number of frames written"""
+    frame_bytes = params[0] * params[1]
+    frames = 0
+    for path in paths:
+        for block in iter_pcm(path, *params, block_frames=block_frames):
+            output.writeframes(block)
+            frames += len(block) // frame_bytes
+    return frames
+
+
+def escape_metadata(value):
+    for character in "\\=;#\n":
+        value = value.replace(character, "\\" + character)
+    return value
+
+
+def chapter_metadata(markers, framerate, title=None):
+    """FFMETADATA text for chapters given as (title, start frame, end frame)"""
+    lines = [";FFMETADATA1"]
+    if title:
+        lines.append("title=" + escape_metadata(title))
+    for chapter, start, end in markers:
+        lines += [
+            "[CHAPTER]",
+            "TIMEBASE=1/{0}".format(framerate),
+            "START={0}".format(start),
+            "END={0}".format(end),
+            "title=" + escape_metadata(chapter),
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def export_book(chapters, page_audio, output_path, codec=None, bitrate=None, title=None):
+    """Stream every chapter's pages into a single file in one pass, then add chapter markers.
+    Markers are counted in frames as the audio is written, so they land exactly on page
+    boundaries; adding them copies the encoded stream without re-encoding it."""
+    assigned = [(chapter, paths) for chapter, paths in chapter_page_audio(chapters, page_audio) if paths]
+    if not assigned:
+        raise ValueError("No page audio for any chapter")
+    params = pcm_params(assigned[0][1][0])
+    stem, extension = os.path.splitext(output_path)
+    encoded_path = stem + ".partial" + extension
+    markers = []
+    frames = 0
+    with open_encoder(encoded_path, *params, codec=codec, bitrate=bitrate) as output:
+        for chapter, paths in assigned:
+            start = frames
+            frames += stream_pages(output, paths, params)
+            markers.append((chapter_title(chapter), start, frames))
+    if (codec or EXTENSIONS[extension]) == "wav":
+        # WAV has no chapter markers
+        os.replace(encoded_path, output_path)
+        return output_path
+    metadata_path = stem + ".chapters.txt"
+    with open(metadata_path, "w") as f:
+        f.write(chapter_metadata(markers, params[2], title))
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-i", encoded_path, "-i", metadata_path,
+             "-map", "0", "-map_metadata", "1", "-map_chapters", "1", "-c", "copy", output_path],
+            check=True,
+        )
+    finally:
+        os.remove(encoded_path)
+        os.remove(metadata_path)
+    return output_path
+
+
+def export_chapters(chapters, page_audio, output_dir, codec=None, bitrate=None):
+    """Write one file per chapter, chapter_<number>.<ext>, each streamed from its own pages"""
+    os.makedirs(output_dir, exist_ok=True)
+    exported = []
+    for chapter, paths in chapter_page_audio(chapters, page_audio):
+        if not paths:
+            continue
+        output_path = os.path.join(output_dir, audio_file_name("chapter_{0}".format(chapter.chapter_number), codec))
+        params = pcm_params(paths[0])
+        with open_encoder(output_path, *params, codec=codec, bitrate=bitrate) as output:
+            stream_pages(output, paths, params)
+        exported.append(output_path)
+    return exported
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from figures import DetectedFigure, detect_figures, prepare_figure_image
+from layout import detect_running_lines
+
+EXTENSIONS = {"image/jpeg": "jpg", "image/webp": "webp"}
+
+
+def pdf_page_hash(page):
+    """Hash of a fitz page's content stream and size, which its extracted outputs depend on"""
+    page_hash = hashlib.sha256(page.read_contents())
+    page_hash.update(str(page.rect).encode("utf-8"))
+    return page_hash.hexdigest()
+
+
+def page_directory(outputs_dir, page_number):
+    return os.path.join(outputs_dir, "pages", str(page_number))
+
+
+def artifact_path(outputs_dir, page_number):
+    return os.path.join(page_directory(outputs_dir, page_number), "text", "extracted.json")
+
+
+def compact_blocks(blocks):
+    """PyMuPDF "dict" blocks without the raw image bytes, which nothing downstream reads"""
+    return [
+        {"type": 1, "bbox": block["bbox"]} if block["type"] == 1 else block
+        for block in blocks
+    ]
+
+
+def extract_page(page, page_number, outputs_dir):
+    """Render a fitz page and write everything the later stages need from it: the page image,
+    its text and blocks, and the detected figures with their cropped images.
+    A page whose artifact was already written from the same PDF content is left alone."""
+    page_hash = pdf_page_hash(page)
+    path = artifact_path(outputs_dir, page_number)
+    image_dir = os.path.join(page_directory(outputs_dir, page_number), "image")
+    image_path = os.path.join(image_dir, "page.png")
+    if os.path.exists(path) and os.path.exists(image_path):
+        with open(path, "r") as f:
+            if json.load(f)["pdf_page"] == page_hash:
+                return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.makedirs(image_dir, exist_ok=True)
+    page.get_pixmap().save(image_path)
+    blocks = page.get_text("dict")["blocks"]
+    figures = []
+    for figure in detect_figures(page, blocks):
+        image, mime_type = prepare_figure_image(page, figure.bbox)
+        figure_path = os.path.join(
+            image_dir, "figure-{0}.{1}".format(figure.figure_name, EXTENSIONS[mime_type])
+        )
+        with open(figure_path, "wb") as f:
+            f.write(image)
+        figures.append(
+            {
+                "figure_name": figure.figure_name,
+                "bbox": list(figure.bbox),
+                "caption": figure.caption,
+                "image_path": figure_path,
+                "mime_type": mime_type,
+            }
+        )
+    artifact = {
+        "page_number": page_number,
+        "pdf_page": page_hash,
+        "rect": list(page.rect),
+        "text": page.get_text(),
+        "blocks": compact_blocks(blocks),
+        "figures": figures,
+    }
+    tmp_path = path + ".{0}.tmp".format(os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(artifact, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+_documents = {}
+
+
+def extract_page_range(doc_path, page_numbers, outputs_dir):
+    """Process-pool entry point: extract a run of pages, opening the PDF once per process"""
+    import fitz
+
+    if doc_path not in _documents:
+        _documents[doc_path] = fitz.open(doc_path)
+    doc = _documents[doc_path]
+    return [extract_page(doc[page_number], page_number, outputs_dir) for page_number in page_numbers]
+
+
+def extract_pages(doc_path, page_numbers, outputs_dir, processes=None, pages_per_task=8):
+    """Extract every page up front, split across a process pool since PyMuPDF holds the GIL.
+    Pages go out in short contiguous runs so a slow run of pages doesn't hold up one process.
+    Returns {page_number: artifact path}."""
+    page_numbers = list(page_numbers)
+    runs = [page_numbers[i : i + pages_per_task] for i in range(0, len(page_numbers), pages_per_task)]
+    paths = {}
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(extract_page_range, doc_path, run, outputs_dir) for run in runs]
+        for run, future in zip(runs, futures):
+            paths.update(zip(run, future.result()))
+    return paths
+
+
+class ExtractedPage:
+    """A page's extraction artifact. Stands in for the fitz page in the cleanup, figure and
+    TTS stages, so they only read what the pre-pass wrote and never open the PDF."""
+
+    def __init__(self, artifact):
+        self.page_number = artifact["page_number"]
+        self.pdf_page_hash = artifact["pdf_page"]
+        self.rect = tuple(artifact["rect"])
+        self.text = artifact["text"]
+        self.blocks = artifact["blocks"]
+        self.figures = [
+            DetectedFigure(figure["figure_name"], tuple(figure["bbox"]), figure["caption"])
+            for figure in artifact["figures"]
+        ]
+        self._figure_files = {
+            figure["figure_name"]: (figure["image_path"], figure["mime_type"])
+            for figure in artifact["figures"]
+        }
+
+    @classmethod
+    def load(cls, outputs_dir, page_number):
+        with open(artifact_path(outputs_dir, page_number), "r") as f:
+            return cls(json.load(f))
+
+    def get_text(self, option="text"):
+        if option == "dict":
+            return {"blocks": self.blocks}
+        return self.text
+
+    def figure_image(self, figure_name):
+        """(encoded bytes, mime type) of the figure's cropped image"""
+        image_path, mime_type = self._figure_files[figure_name]
+        with open(image_path, "rb") as f:
+            return f.read(), mime_type
+
+
+def find_running_lines(outputs_dir, chapters):
+    """Detect repeated headers, footers and page numbers chapter by chapter from the extracted pages.
+    Returns {page_number: mask} for every page in the chapters."""
+    masks = {}
+    for chapter in chapters:
+        pages = range(chapter.chapter_start_page, chapter.chapter_end_page + 1)
+        masks.update(detect_running_lines((n, ExtractedPage.load(outputs_dir, n)) for n in pages))
+    return masks
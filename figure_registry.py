@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+
+class FigureRegistry:
+    """The figures of one book that have been claimed for description, and their descriptions,
+    shared by every page builder through the outputs volume.
+    A page claims a figure by creating its claim file exclusively, which succeeds for exactly one
+    page even with pages building concurrently in different containers, so each figure goes to the
+    vision model once. Each description is its own small JSON file, replaced atomically, so they
+    are stored as they are made instead of as one list that every page rewrites."""
+
+    def __init__(self, directory, stale_seconds=1800):
+        self.directory = directory
+        # a claim this old with no description belongs to a page that died; 1800s is the page builder's timeout
+        self.stale_seconds = stale_seconds
+        self._described = {}  # figure name: description record, for the figures this process has seen finished
+
+    def _path(self, figure_name, extension):
+        stem = re.sub(r"[^\w.-]", "_", figure_name)
+        if stem != figure_name:  # keep names that only differ in unsafe characters apart
+            stem += "-" + hashlib.sha256(figure_name.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.directory, stem + extension)
+
+    def owner(self, figure_name):
+        """The page number that claimed figure_name, or None"""
+        try:
+            with open(self._path(figure_name, ".claim"), "r") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None  # unclaimed, or the claim is still being written
+
+    def __contains__(self, figure_name):
+        return figure_name in self._described or os.path.exists(self._path(figure_name, ".claim"))
+
+    def claim(self, figure_name, page_number):
+        """True when page_number owns figure_name and should describe it: it was unclaimed, was already
+        claimed by the same page (a retry or a rebuild), or its claim went stale without a description.
+        False when another page owns it."""
+        if figure_name in self._described:
+            return self._described[figure_name]["page_number"] == page_number
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(figure_name, ".claim")
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                if self.owner(figure_name) == page_number:
+                    return True
+                if self.description(figure_name) is None and self._break_if_stale(path):
+                    continue
+                return False
+            try:
+                os.write(fd, str(page_number).encode("utf-8"))
+            finally:
+                os.close(fd)
+            return True
+        return False
+
+    def _break_if_stale(self, path):
+        """Move a stale claim aside so it can be claimed again. Only one of several pages
+        breaking the same claim gets to rename it; the others find it gone and race to re-claim."""
+        try:
+            if time.time() - os.path.getmtime(path) < self.stale_seconds:
+                return False
+            stale_path = "{0}.stale-{1}".format(path, uuid.uuid4().hex)
+            os.rename(path, stale_path)
+            if time.time() - os.path.getmtime(stale_path) < self.stale_seconds:
+                # another page re-claimed it between the check and the rename; put its claim back
+                try:
+                    os.link(stale_path, path)
+                except FileExistsError:
+                    pass
+                os.remove(stale_path)
+                return False
+            os.remove(stale_path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def release(self, figure_name, page_number):
+        """Give up page_number's claim on a figure it could not describe, so another page can"""
+        if self.owner(figure_name) == page_number and self.description(figure_name) is None:
+            try:
+                os.remove(self._path(figure_name, ".claim"))
+            except FileNotFoundError:
+                pass
+
+    def record(self, figure_name, page_number, description):
+        """Store the description of a figure page_number claimed"""
+        record = {"figure_name": figure_name, "page_number": page_number, "figure_description": description}
+        path = self._path(figure_name, ".json")
+        tmp_path = path + ".{0}.tmp".format(os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+        self._described[figure_name] = record
+        return record
+
+    def description(self, figure_name):
+        """The stored description of figure_name, or None if it hasn't been described yet"""
+        if figure_name not in self._described:
+            try:
+                with open(self._path(figure_name, ".json"), "r") as f:
+                    self._described[figure_name] = json.load(f)
+            except FileNotFoundError:
+                return None
+        return self._described[figure_name]["figure_description"]
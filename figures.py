@@ -0,0 +1,153 @@
+import re
+from dataclasses import dataclass
+
+# A caption block starts with the figure's label; references in running text don't
+FIGURE_CAPTION = re.compile(r"^\s*(?:Figure|Fig\.)\s+(\d+\.\d+)")
+
+
+@dataclass
+class DetectedFigure:
+    figure_name: str
+    bbox: tuple  # (x0, y0, x1, y1) covering the graphic and its caption
+    caption: str
+
+
+def union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def area(bbox):
+    return max(0, bbox[2] - bbox[0]) * max(0, bbox[3] - bbox[1])
+
+
+def near(a, b, gap):
+    """True when the boxes overlap or are within gap points of each other"""
+    return (
+        a[0] - gap <= b[2]
+        and b[0] - gap <= a[2]
+        and a[1] - gap <= b[3]
+        and b[1] - gap <= a[3]
+    )
+
+
+def merge_regions(boxes, gap):
+    """Merge boxes that touch or nearly touch into single regions"""
+    regions = []
+    for box in boxes:
+        box = tuple(box)
+        merged = True
+        while merged:
+            merged = False
+            for i, region in enumerate(regions):
+                if near(region, box, gap):
+                    box = union(region, regions.pop(i))
+                    merged = True
+                    break
+        regions.append(box)
+    return regions
+
+
+def graphic_regions(page, blocks, min_area_fraction=0.01, gap=6):
+    """Bounding boxes of the images and vector drawings on a PyMuPDF page.
+    Nearby pieces are merged into one region, and regions too small to be a figure
+    (rules, underlines, bullets) are dropped."""
+    boxes = []
+    for block in blocks:
+        if block["type"] == 1:  # image block
+            boxes.append(block["bbox"])
+    for image in page.get_images(full=True):
+        boxes.extend(tuple(rect) for rect in page.get_image_rects(image[0]))
+    page_area = area(tuple(page.rect))
+    for drawing in page.get_drawings():
+        # page-sized fills are backgrounds, not figures
+        if area(tuple(drawing["rect"])) < page_area * 0.9:
+            boxes.append(tuple(drawing["rect"]))
+    min_area = page_area * min_area_fraction
+    return [region for region in merge_regions(boxes, gap) if area(region) >= min_area]
+
+
+def caption_blocks(blocks):
+    """(figure_name, bbox, text) for each text block that starts with a figure label"""
+    captions = []
+    for block in blocks:
+        if block["type"] != 0:
+            continue
+        text = " ".join(
+            span["text"] for line in block["lines"] for span in line["spans"]
+        ).strip()
+        match = FIGURE_CAPTION.match(text)
+        if match:
+            captions.append((match.group(1), tuple(block["bbox"]), text))
+    return captions
+
+
+def detect_figures(page, blocks=None, max_caption_gap=36):
+    """Figures actually drawn on the page, found from its structure instead of a vision call.
+    A figure is confirmed when a caption block starting with its label sits directly above
+    or below an image or drawing region and overlaps it horizontally."""
+    if blocks is None:
+        blocks = page.get_text("dict")["blocks"]
+    regions = graphic_regions(page, blocks)
+    figures = []
+    for figure_name, caption_bbox, text in caption_blocks(blocks):
+        if figure_name in [figure.figure_name for figure in figures]:
+            continue
+        best = None
+        for region in regions:
+            if caption_bbox[0] > region[2] or region[0] > caption_bbox[2]:
+                continue  # no horizontal overlap
+            gap = max(caption_bbox[1] - region[3], region[1] - caption_bbox[3], 0)
+            if gap <= max_caption_gap and (best is None or gap < best[0]):
+                best = (gap, region)
+        if best is not None:
+            figures.append(DetectedFigure(figure_name, union(best[1], caption_bbox), text))
+    return figures
+
+
+def vision_tokens(width, height):
+    """Approximate input tokens for an image at OpenAI's high detail setting: the image is scaled to
+    fit 2048x2048, then so its short side is at most 768, and billed per 512px tile"""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = -(-int(width) // 512) * -(-int(height) // 512)
+    return 85 + 170 * tiles
+
+
+def encode_pixmap(pixmap, image_format, quality):
+    """Encode a PyMuPDF pixmap as JPEG natively, or as WebP through Pillow"""
+    if image_format == "jpeg":
+        return pixmap.tobytes("jpeg", jpg_quality=quality), "image/jpeg"
+    if image_format == "webp":
+        import io
+        from PIL import Image
+
+        image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=quality)
+        return buffer.getvalue(), "image/webp"
+    raise ValueError(f"{image_format} not supported")
+
+
+def prepare_figure_image(
+    page,
+    bbox,
+    dpi=150,
+    image_format="jpeg",
+    quality=80,
+    max_tokens=765,
+    max_bytes=300 * 1024,
+):
+    """Render just the figure's region of the page and encode it within a size budget.
+    The resolution is lowered until the image fits max_tokens, then the quality until it
+    fits max_bytes. Returns (encoded bytes, mime type), kept in memory rather than on disk."""
+    width_points, height_points = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    while dpi > 36 and vision_tokens(width_points * dpi / 72, height_points * dpi / 72) > max_tokens:
+        dpi = int(dpi * 0.8)
+    pixmap = page.get_pixmap(clip=bbox, dpi=dpi, alpha=False)
+    image, mime_type = encode_pixmap(pixmap, image_format, quality)
+    while len(image) > max_bytes and quality > 30:
+        quality -= 15
+        image, mime_type = encode_pixmap(pixmap, image_format, quality)
+    return image, mime_type
@@ -0,0 +1,80 @@
+import re
+from collections import Counter
+
+# Well-formed numerals only, so margin words spelled with numeral letters ("did", "civil") aren't page numbers
+ROMAN_NUMERAL = re.compile(r"^m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$")
+
+
+def running_line_key(text):
+    """Normalize a header/footer line so repeats that differ only by page number compare equal"""
+    key = " ".join(text.lower().split())
+    if key and ROMAN_NUMERAL.match(key):
+        return "#"
+    return re.sub(r"\d+", "#", key)
+
+
+def block_lines(blocks):
+    """(bbox, text) for every text line of a page's PyMuPDF "dict" blocks"""
+    lines = []
+    for block in blocks:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append((tuple(round(v, 1) for v in line["bbox"]), text))
+    return lines
+
+
+def edge_lines(blocks, page_height, margin=0.12):
+    """Lines inside the top or bottom margin band of the page, tagged with which edge"""
+    edges = []
+    for bbox, text in block_lines(blocks):
+        if bbox[3] <= page_height * margin:
+            edges.append(("top", bbox, text))
+        elif bbox[1] >= page_height * (1 - margin):
+            edges.append(("bottom", bbox, text))
+    return edges
+
+
+def detect_running_lines(pages, min_fraction=0.5, min_pages=3, margin=0.12):
+    """Find headers and footers repeated across a run of pages, such as a chapter, in one pass.
+    pages: iterable of (page_number, fitz page)
+    A line in the top or bottom margin is a running line when the same normalized text appears
+    on that edge of at least min_fraction of the pages; bare page numbers always are.
+    Returns {page_number: [line bbox, ...]} masks of lines to strip."""
+    candidates = {}
+    counts = Counter()
+    for page_number, page in pages:
+        blocks = page.get_text("dict")["blocks"]
+        edges = edge_lines(blocks, page.rect[3], margin)
+        candidates[page_number] = edges
+        for position, _, text in edges:
+            counts[(position, running_line_key(text))] += 1
+    threshold = max(min_pages, min_fraction * len(candidates))
+    masks = {}
+    for page_number, edges in candidates.items():
+        masks[page_number] = [
+            list(bbox)
+            for position, bbox, text in edges
+            if running_line_key(text) == "#" or counts[(position, running_line_key(text))] >= threshold
+        ]
+    return masks
+
+
+def text_without_lines(blocks, mask):
+    """Rebuild a page's text from its blocks, leaving out the masked lines"""
+    masked = {tuple(bbox) for bbox in mask}
+    paragraphs = []
+    for block in blocks:
+        if block["type"] != 0:
+            continue
+        lines = []
+        for line in block["lines"]:
+            bbox = tuple(round(v, 1) for v in line["bbox"])
+            if bbox in masked:
+                continue
+            lines.append("".join(span["text"] for span in line["spans"]))
+        if lines:
+            paragraphs.append("\n".join(lines))
+    return "\n".join(paragraphs) + "\n" if paragraphs else ""
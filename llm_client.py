@@ -0,0 +1,148 @@
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Requests and tokens per minute for each model; models not listed are not limited
+DEFAULT_LIMITS = {
+    "gpt-4-1106-preview": (500, 300000),
+    "gpt-4-vision-preview": (100, 40000),
+    "gpt-4o": (500, 300000),
+}
+
+# litellm exception types worth retrying; matched by name so litellm is only imported when a call is made
+RETRYABLE_ERRORS = {
+    "RateLimitError",
+    "APIConnectionError",
+    "Timeout",
+    "ServiceUnavailableError",
+    "InternalServerError",
+}
+
+
+class TokenBucket:
+    """Allows up to per_minute units a minute, refilled continuously"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount):
+        # a request bigger than the whole bucket waits for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def estimate_tokens(params):
+    """Rough token cost of a request: prompt text at ~4 characters a token, images at a
+    high-detail tile budget, plus the completion tokens it may use"""
+    tokens = params.get("max_tokens", 0)
+    for message in params["messages"]:
+        content = message["content"]
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, str):
+                tokens += len(part) // 4
+            elif part.get("type") == "image_url":
+                tokens += 765
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return tokens
+
+
+def is_retryable(error):
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+class AsyncLLMClient:
+    """Async completions over litellm.acompletion with a per-model requests/tokens-per-minute limit,
+    jittered exponential backoff on rate limits and transient errors, and coalescing of
+    identical requests already in flight into one call."""
+
+    def __init__(self, limits=None, max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+
+    async def acompletion(self, **params):
+        from litellm import acompletion
+
+        return await acompletion(**params)
+
+    async def _limit(self, params):
+        model = params["model"]
+        if model not in self.limits:
+            return
+        if model not in self._buckets:
+            requests_per_minute, tokens_per_minute = self.limits[model]
+            self._buckets[model] = (
+                TokenBucket(requests_per_minute),
+                TokenBucket(tokens_per_minute),
+            )
+        requests, tokens = self._buckets[model]
+        await requests.acquire(1)
+        await tokens.acquire(estimate_tokens(params))
+
+    async def _complete(self, params):
+        for attempt in range(self.max_retries + 1):
+            await self._limit(params)
+            try:
+                self.calls += 1
+                response = await self.acompletion(**params)
+                return response.choices[0].message.content
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                # full jitter, so throttled workers don't all retry at the same moment
+                delay = min(self.max_delay, self.base_delay * 2**attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def complete(self, **params):
+        """Return the completion text for params. An identical request already in flight on
+        this event loop is awaited instead of being sent again."""
+        key = (id(asyncio.get_running_loop()), json.dumps(params, sort_keys=True))
+        if key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+        task = asyncio.ensure_future(self._complete(params))
+        self._in_flight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._in_flight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "retries": self.retries}
+
+
+def run_sync(coroutine):
+    """Run a coroutine from synchronous code, even when called from inside a running event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -0,0 +1,58 @@
+import json
+import os
+
+# Pipeline stages in the order a page reaches them, and the inputs each one depends on
+STAGES = ["extracted", "read_aloud"]
+STAGE_INPUTS = {
+    "extracted": ["pdf_page", "header", "footer", "strip_mask", "prompt_version"],
+    "read_aloud": ["pdf_page", "header", "footer", "strip_mask", "prompt_version", "speaker", "codec"],
+}
+
+
+class Manifest:
+    """Per-book record of how far each page got, what inputs it was built from and where its outputs are.
+    Each page is its own small JSON file, replaced atomically, so pages finishing concurrently
+    in different containers never overwrite each other's progress."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, page_number):
+        return os.path.join(self.directory, "{0}.json".format(page_number))
+
+    def get(self, page_number):
+        try:
+            with open(self._path(page_number), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def is_done(self, page_number, stage, fingerprint):
+        """True when the page already reached stage from the same inputs and its outputs still exist"""
+        entry = self.get(page_number)
+        if entry is None:
+            return False
+        if STAGES.index(entry["stage"]) < STAGES.index(stage):
+            return False
+        for key in STAGE_INPUTS[stage]:
+            if entry["fingerprint"].get(key) != fingerprint.get(key):
+                return False
+        return all(os.path.exists(path) for path in entry["outputs"].values())
+
+    def record(self, page_number, stage, fingerprint, outputs, page=None):
+        """Record that the page reached stage. Outputs of earlier stages are kept, later ones dropped."""
+        entry = self.get(page_number)
+        if entry is None or STAGES.index(stage) == 0:
+            entry = {"page_number": page_number, "outputs": {}, "page": None}
+        entry["stage"] = stage
+        entry["fingerprint"] = fingerprint
+        entry["outputs"].update(outputs)
+        if page is not None:
+            entry["page"] = page
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(page_number)
+        tmp_path = path + ".{0}.tmp".format(os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        return entry
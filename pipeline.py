@@ -0,0 +1,139 @@
+import asyncio
+import random
+import traceback
+
+
+class PageFailed(Exception):
+    """A page that still failed after all of its retries"""
+
+    def __init__(self, page_number, stage, error):
+        super().__init__(f"page {page_number} failed in {stage}: {error!r}")
+        self.page_number = page_number
+        self.stage = stage
+        self.error = error
+
+
+async def run_with_retries(stage, *args, retries=2, backoff=2.0):
+    """Await stage(*args), retrying failures with jittered exponential backoff"""
+    for attempt in range(retries + 1):
+        try:
+            return await stage(*args)
+        except Exception:
+            if attempt == retries:
+                raise
+            traceback.print_exc()
+            await asyncio.sleep(backoff * (2**attempt) * random.uniform(0.5, 1.5))
+
+
+async def run_pages(
+    page_numbers,
+    extract_stage,
+    tts_stage,
+    concurrency=16,
+    tts_concurrency=4,
+    retries=2,
+):
+    """Run every page through extract_stage(page_number) and then tts_stage(page_json).
+    Each stage has its own concurrency limit, so pages being read aloud overlap with pages
+    still being extracted and cleaned up. Results come back in page order; a page that
+    fails after its retries is returned as a PageFailed instead of stopping the run."""
+    extract_slots = asyncio.Semaphore(concurrency)
+    tts_slots = asyncio.Semaphore(tts_concurrency)
+
+    async def run_page(page_number):
+        async with extract_slots:
+            try:
+                page_json = await run_with_retries(
+                    extract_stage, page_number, retries=retries
+                )
+            except Exception as e:
+                return PageFailed(page_number, "extract", e)
+        async with tts_slots:
+            try:
+                return await run_with_retries(tts_stage, page_json, retries=retries)
+            except Exception as e:
+                return PageFailed(page_number, "tts", e)
+
+    results = await asyncio.gather(*[run_page(n) for n in page_numbers])
+    failed = [result for result in results if isinstance(result, PageFailed)]
+    if failed:
+        print(f"{len(failed)} of {len(results)} pages failed:")
+        for failure in failed:
+            print(f"  {failure}")
+    return results
+
+
+def skip_if_read(read_stage):
+    """Wrap a TTS stage so pages whose audio the manifest shows is up to date are not sent to it"""
+
+    async def stage(page_json):
+        if page_json["read_aloud"]:
+            return {"page_number": page_json["page_number"], "path": page_json["page_audio_uri"], "stats": None}
+        return await read_stage(page_json)
+
+    return stage
+
+
+def count_cleanups(extract_stage, counts):
+    """Wrap an extract stage to tally pages that needed the cleanup LLM against pages that skipped it"""
+
+    async def stage(page_number):
+        page_json = await extract_stage(page_number)
+        counts["llm" if page_json["llm_cleanup"] else "skipped"] += 1
+        return page_json
+
+    return stage
+
+
+def report_reader_stats(results):
+    """Print model load time and steady-state throughput separately, one line per TTS worker"""
+    latest = {}
+    skipped = 0
+    for result in results:
+        stats = result["stats"]
+        if stats is None:
+            skipped += 1
+            continue
+        # stats are cumulative per worker, so keep the most complete snapshot of each
+        key = stats["worker_id"]
+        if key not in latest or stats["pages_read"] > latest[key]["pages_read"]:
+            latest[key] = stats
+    for stats in latest.values():
+        print(f"load {stats['load_seconds']:.1f}s, {stats['pages_read']} pages in {stats['synth_seconds']:.1f}s "
+              f"({stats['pages_per_minute']:.1f} pages/min, {stats['chars_per_second']:.0f} chars/s), "
+              f"audio cache hit rate {stats['audio_cache']['hit_rate']:.0%}")
+    if skipped:
+        print(f"{skipped} pages were already read aloud and skipped")
+
+
+async def convert_book(backend, doc_path, chapters, book_id, concurrency=16, tts_concurrency=4, retries=2):
+    """Run the whole book on an execution backend (see backends.py): download the TTS model, share the
+    chapters through the backend's working document, extract the PDF, then build and read every page.
+    Figure descriptions aren't in the working document; each page claims its figures in the book's
+    FigureRegistry.
+    Returns the run_pages results."""
+    await backend.download_tts_model()
+    print("TTS model downloaded")
+
+    await backend.working_doc.put("chapters", chapters)
+
+    page_numbers = chapters.page_numbers()
+    strip_masks = await backend.extract_pdf(doc_path, chapters, page_numbers)
+
+    cleanup_counts = {"llm": 0, "skipped": 0}
+    results = await run_pages(
+        page_numbers,
+        count_cleanups(
+            lambda page_number: backend.make_page(doc_path, page_number, book_id, strip_masks[page_number]),
+            cleanup_counts,
+        ),
+        skip_if_read(lambda page_json: backend.read_page_aloud(page_json, book_id)),
+        concurrency=concurrency,
+        tts_concurrency=tts_concurrency,
+        retries=retries,
+    )
+
+    report_reader_stats([result for result in results if not isinstance(result, PageFailed)])
+    print(f"Cleanup LLM skipped for {cleanup_counts['skipped']} of "
+          f"{cleanup_counts['llm'] + cleanup_counts['skipped']} pages")
+    return results
@@ -0,0 +1,38 @@
+"""Run the whole pipeline on this machine without Modal, for profiling throughput on CPU machines and in CI:
+python run_local.py --pdf mount/book.pdf --outputs outputs --concurrency 4 --tts-concurrency 1"""
+import argparse
+import asyncio
+import time
+from backends import InMemoryDict, LocalBackend, SQLiteDict
+from cache import file_sha256
+from chapters import load_chapters_from_yaml
+from pipeline import PageFailed, convert_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a book on local process pools")
+    parser.add_argument("--pdf", default="mount/book.pdf")
+    parser.add_argument("--chapters", default="chapters.yaml")
+    parser.add_argument("--outputs", default="outputs", help="Local directory used in place of /outputs")
+    parser.add_argument("--speaker", default="mount/speaker-longer-enhanced-90p.wav")
+    parser.add_argument("--working-doc", default=None,
+                        help="SQLite file for the working document; kept in memory by default")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tts-concurrency", type=int, default=1)
+    parser.add_argument("--retries", type=int, default=2)
+    args = parser.parse_args()
+
+    chapters = load_chapters_from_yaml(args.chapters)
+    book_id = file_sha256(args.pdf)[:16]
+    working_doc = SQLiteDict(args.working_doc) if args.working_doc else InMemoryDict()
+    started = time.perf_counter()
+    with LocalBackend(args.outputs, working_doc, args.concurrency, args.tts_concurrency, args.speaker) as backend:
+        results = asyncio.run(convert_book(backend, args.pdf, chapters, book_id, args.concurrency,
+                                           args.tts_concurrency, args.retries))
+    elapsed = time.perf_counter() - started
+    finished = sum(1 for result in results if not isinstance(result, PageFailed))
+    print(f"{finished} of {len(results)} pages in {elapsed:.1f}s ({60 * finished / elapsed:.1f} pages/min end to end)")
+
+
+if __name__ == "__main__":
+    main()
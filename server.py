@@ -1,6 +1,14 @@
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import mimetypes
 import modal
 import os
+from archives import iter_tar
+from audio import CODECS
+from cache import saved_file_sha256
+from catalog import Catalog
+from chapters import ChapterMap, load_chapters_from_yaml
+from downloads import iter_file_range, parse_range
 
 image = (
     modal.Image
@@ -11,10 +19,18 @@ image = (
                    "torch",
                    "litellm",
                    "pydub",
-                   "tqdm"])
+                   "tqdm",
+                   "pydantic==2.5.2",
+                   "pyyaml"])
 )
 
-mounts = [modal.Mount.from_local_dir("/Users/max/Documents/rethink-stats/audiobook/mount", remote_path="/mount")]
+# mount/ next to this file unless AUDIOBOOK_MOUNT points elsewhere
+MOUNT_DIR = os.getenv("AUDIOBOOK_MOUNT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mount"))
+mounts = [modal.Mount.from_local_dir(MOUNT_DIR, remote_path="/mount")]
+# the chapters the book was converted with, so pages indexed by the server get their chapter
+CHAPTERS_FILE = os.getenv("AUDIOBOOK_CHAPTERS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chapters.yaml"))
+if os.path.exists(CHAPTERS_FILE):
+    mounts.append(modal.Mount.from_local_file(CHAPTERS_FILE, remote_path="/chapters.yaml"))
 volume = modal.NetworkFileSystem.persisted("job-storage-vol")
 
 stub = modal.Stub(name="audiobook-server")
@@ -22,12 +38,61 @@ stub = modal.Stub(name="audiobook-server")
 
 endpoint = modal.web_endpoint
 
+# Kept across requests in a warm container, so each listing only reads what was appended since the last
+catalog = Catalog("/outputs/catalog")
+
+
+BACKFILL_MARKER = os.path.join(catalog.directory, "backfilled")
+
+
+def load_catalog():
+    '''The catalog, after indexing the page audio it is missing once: pages read aloud before the
+    catalog existed. The marker file records that a container already did this.'''
+    if not os.path.exists(BACKFILL_MARKER):
+        chapters = load_chapters_from_yaml("/chapters.yaml") if os.path.exists("/chapters.yaml") else ChapterMap([])
+        indexed = catalog.entries()
+        for dir in os.listdir("/outputs/pages/"):
+            if not dir.isdigit() or int(dir) in indexed:
+                continue
+            path, _ = page_audio_file(dir)
+            if path:
+                chapter = chapters.chapter_for_page(int(dir))
+                catalog.record(int(dir), path, chapter.chapter_number if chapter else None)
+        os.makedirs(catalog.directory, exist_ok=True)
+        open(BACKFILL_MARKER, "w").close()
+    return catalog
+
+
+def page_audio_file(dir_name):
+    """The page's combined audio, in whichever codec it was encoded, and that codec"""
+    for codec, (_, _, extension) in CODECS.items():
+        path = f"/outputs/pages/{dir_name}/audio/combined{extension}"
+        if os.path.isfile(path):
+            return path, codec
+    return None, None
+
 @stub.function(network_file_systems={"/outputs": volume}, image=image, mounts=mounts)
 @endpoint(label="download-waves")
-async def download_combined_wavs(dir_name: str):
-    remote_file = f"/outputs/pages/{dir_name}/audio/combined.wav"
-    if os.path.isfile(remote_file) and os.path.getsize(remote_file) > 500:
-        return FileResponse(remote_file)
+async def download_combined_wavs(dir_name: str, request: Request):
+    '''Serve the page's audio, or the byte range a resuming client asks for, with its SHA-256 in X-Content-SHA256'''
+    remote_file, _ = page_audio_file(dir_name)
+    if remote_file and os.path.getsize(remote_file) > 500:
+        size = os.path.getsize(remote_file)
+        headers = {"Accept-Ranges": "bytes", "X-Content-SHA256": saved_file_sha256(remote_file)}
+        try:
+            span = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", **headers})
+        status_code = 200
+        start, end = 0, size - 1
+        if span is not None:
+            start, end = span
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        media_type = mimetypes.guess_type(remote_file)[0] or "application/octet-stream"
+        return StreamingResponse(iter_file_range(remote_file, start, end), status_code=status_code,
+                                 headers=headers, media_type=media_type)
     else:
         return False
     
@@ -36,24 +101,39 @@ async def download_combined_wavs(dir_name: str):
 async def delete_combined_wavs(dir_name: str):
     print(dir_name)
     print(os.listdir("/outputs/pages/"))
-    remote_directory = f"/outputs/pages/{dir_name}/"
+    remote_directory = f"/outputs/pages/{dir_name}/audio/"
     print(os.listdir(remote_directory))
-    wav_file = remote_directory + "combined.wav"
-    if os.path.exists(wav_file):
+    wav_file, _ = page_audio_file(dir_name)
+    if wav_file:
         os.remove(wav_file)  # delete the original file
+        if os.path.exists(wav_file + ".sha256"):
+            os.remove(wav_file + ".sha256")
+        catalog.remove(int(dir_name))
         return True
     else:
         return False
     
 @stub.function(network_file_systems={"/outputs": volume}, image=image, mounts=mounts)
 @endpoint(label="list-waves")
-async def list_all_wavs():
-    directories = os.listdir("/outputs/pages/")
-    print(directories)
-    wav_directories = [dir for dir in directories if os.path.isfile(f"/outputs/pages/{dir}/audio/combined.wav")]
-    #return file size also {dir: directors, size: size}
-    wav_directories = [{"dir": dir, "size": os.path.getsize(f"/outputs/pages/{dir}/audio/combined.wav")} for dir in wav_directories]
-    if len(wav_directories) == 0:
-        return False
-    print('filled: ', wav_directories)
-    return JSONResponse(content=wav_directories)
+async def list_all_wavs(chapter: int = None, modified_since: float = None, offset: int = 0, limit: int = 100):
+    '''Page audio from the catalog the pipeline writes as pages finish, in page order,
+    optionally only one chapter's or only pages modified since a unix time'''
+    load_catalog()
+    entries, total = catalog.list(chapter, modified_since, offset, limit)
+    files = [{"dir": str(entry["page_number"]), **entry} for entry in entries]
+    next_offset = offset + len(files) if offset + len(files) < total else None
+    return JSONResponse(content={"files": files, "total": total, "next_offset": next_offset})
+
+@stub.function(network_file_systems={"/outputs": volume}, image=image, mounts=mounts, timeout=1800)
+@endpoint(label="archive-waves")
+async def archive_combined_wavs(chapter: int = None, start_page: int = None, end_page: int = None):
+    '''Stream a tar of the audio for a chapter or a page range in one response, built as it is sent.
+    Members are named <page number>.<ext> and carry their SHA-256.'''
+    entries = [entry for page_number, entry in sorted(load_catalog().entries().items())
+               if (chapter is None or entry["chapter_number"] == chapter)
+               and (start_page is None or page_number >= start_page)
+               and (end_page is None or page_number <= end_page)
+               and os.path.isfile(entry["path"])]
+    files = [(f"{entry['page_number']}{CODECS[entry['codec']][2]}", entry["path"], entry["sha256"])
+             for entry in entries]
+    return StreamingResponse(iter_tar(files), media_type="application/x-tar")
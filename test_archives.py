@@ -0,0 +1,75 @@
+import hashlib
+import io
+import os
+import pytest
+from archives import iter_tar, unpack_tar
+
+
+class Stream(io.RawIOBase):
+    """A non-seekable reader over a generator of byte blocks, like an HTTP response body"""
+
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.blocks, None)
+            if self.pending is None:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def write_pages(directory, sizes):
+    files = []
+    for page_number, size in sizes.items():
+        path = os.path.join(directory, 'combined-{0}.opus'.format(page_number))
+        content = os.urandom(size)
+        with open(path, 'wb') as f:
+            f.write(content)
+        files.append(('{0}.opus'.format(page_number), path, hashlib.sha256(content).hexdigest()))
+    return files
+
+
+def test_archive_streams_and_unpacks_page_by_page(tmp_path):
+    files = write_pages(str(tmp_path), {3: 700, 4: 512, 5: 3000})
+    blocks = list(iter_tar(files, block_size=256))
+    assert max(len(block) for block in blocks) <= 1536  # no file is sent whole
+
+    paths = unpack_tar(Stream(blocks), str(tmp_path / 'out'), chunk_size=100)
+    assert [os.path.basename(path) for path in paths] == ['3.opus', '4.opus', '5.opus']
+    for (_, source, _), path in zip(files, paths):
+        with open(source, 'rb') as a, open(path, 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_member_rewritten_while_streaming_keeps_its_header_size(tmp_path):
+    files = write_pages(str(tmp_path), {3: 700, 4: 512})
+    stream = iter_tar(files, block_size=256)
+    next(stream)  # header for page 3, sized at 700 bytes
+    with open(files[0][1], 'ab') as f:
+        f.write(b'x' * 300)  # re-encoded longer mid-stream
+    blocks = [next(stream) for _ in range(3)]
+    assert sum(len(block) for block in blocks) == 700
+
+    files = write_pages(str(tmp_path), {3: 700})
+    stream = iter_tar(files, block_size=256)
+    next(stream)
+    with open(files[0][1], 'wb') as f:
+        f.write(b'x' * 100)  # re-encoded shorter mid-stream
+    with pytest.raises(ValueError):
+        list(stream)
+
+
+def test_corrupt_member_is_rejected(tmp_path):
+    files = write_pages(str(tmp_path), {3: 700})
+    files[0] = files[0][:2] + ('0' * 64,)
+    with pytest.raises(ValueError):
+        unpack_tar(Stream(iter_tar(files)), str(tmp_path / 'out'))
+    assert os.listdir(tmp_path / 'out') == []
@@ -0,0 +1,86 @@
+import io
+import os
+import wave
+from unittest.mock import patch
+import audio
+from audio import audio_duration, audio_file_name, concatenate_audio, concatenate_audio_pydub, open_encoder
+
+
+def write_wav(path, frames, framerate=24000):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(framerate)
+        f.writeframes(b'\x01\x00' * frames)
+
+
+class FakeStdin:
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def close(self):
+        pass
+
+
+class FakeProcess:
+    """Stands in for an ffmpeg encoder process, counting the PCM written to it"""
+
+    def __init__(self, command, **kwargs):
+        self.command = command
+        self.stdin = FakeStdin()
+        self.stderr = io.BytesIO()
+        processes.append(self)
+
+    def wait(self):
+        open(self.command[-1], 'wb').close()  # the encoded file
+        return 0
+
+
+processes = []
+
+
+def test_concatenate_skips_stale_outputs(tmp_path):
+    for name, frames in [('0.wav', 100), ('1.wav', 250), ('combined.wav', 999), ('combined.opus', 0)]:
+        write_wav(str(tmp_path / name), frames)
+    output_path = concatenate_audio_pydub(str(tmp_path), 'combined.wav', verbose=0)
+    with wave.open(output_path, 'rb') as f:
+        assert f.getnframes() == 350
+    assert audio_duration(output_path) == 350 / 24000
+
+
+def test_compressed_output_is_streamed_to_ffmpeg(tmp_path):
+    paths = [str(tmp_path / '0.wav'), str(tmp_path / '1.wav')]
+    write_wav(paths[0], 100)
+    write_wav(paths[1], 70000)
+    processes.clear()
+    with patch('audio.subprocess.Popen', FakeProcess):
+        concatenate_audio(paths, str(tmp_path / 'page.opus'), block_frames=1000)
+    command = processes[0].command
+    assert command[command.index('-c:a') + 1] == 'libopus'
+    assert command[command.index('-f') + 1:command.index('-i')] == ['s16le', '-ar', '24000', '-ac', '1']
+    assert processes[0].stdin.written == 2 * 70100
+    # encoded beside the output and moved into place once ffmpeg finishes
+    assert command[-1] != str(tmp_path / 'page.opus')
+    assert sorted(os.listdir(tmp_path)) == ['0.wav', '1.wav', 'page.opus']
+
+
+def test_failed_encode_leaves_the_previous_file(tmp_path):
+    path = str(tmp_path / 'combined.wav')
+    write_wav(path, 100)
+    try:
+        with open_encoder(path, 1, 2, 24000) as output:
+            output.writeframes(b'\x00\x00' * 50)
+            raise RuntimeError('interrupted')
+    except RuntimeError:
+        pass
+    assert os.listdir(tmp_path) == ['combined.wav']
+    with wave.open(path, 'rb') as f:
+        assert f.getnframes() == 100
+
+
+def test_audio_file_name_uses_codec_extension():
+    assert audio_file_name('combined', 'aac') == 'combined.m4a'
+    assert audio_file_name('combined') == 'combined' + audio.CODECS[audio.OUTPUT_CODEC][2]
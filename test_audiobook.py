@@ -1,15 +1,26 @@
 import pytest
-from audiobook import setup_tts, describe_image, chunk_text, concatenate_audio_pydub, make_page_reading, Page, PydanticPage
+import audiobook
+from audiobook import setup_tts, describe_image, chunk_text, concatenate_audio_pydub, make_page_reading, Page, PydanticPage, TTSWorker, get_speaker_latents, split_sentences
 import os
 import base64
 import shutil
 import tempfile
-from unittest.mock import patch, MagicMock
+import wave
+from unittest.mock import patch, MagicMock, AsyncMock
+from cache import DiskCache
+from figure_registry import FigureRegistry
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(tmp_path, monkeypatch):
+    # keep cached LLM responses from leaking between tests or runs
+    monkeypatch.setattr(audiobook, 'llm_cache', DiskCache(str(tmp_path / 'llm-cache')))
+    monkeypatch.setattr(audiobook, 'audio_cache', DiskCache(str(tmp_path / 'audio-cache')))
+
+
 @pytest.fixture
 def setup_files():
     # Create a temporary directory
@@ -43,20 +54,22 @@ def setup_page_image():
 
     yield temp_image
 
+def write_test_wav(path, frames, framerate=24000):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(framerate)
+        f.writeframes(b'\x01\x00' * frames)
+
+
 @pytest.fixture
 def setup_audio_files():
     # Create a temporary directory
     temp_dir = tempfile.mkdtemp()
 
-    # Create a temporary audio file
-    temp_audio = os.path.join(temp_dir, '1.wav')
-    with open(temp_audio, 'w') as f:
-        f.write('This is a test audio file')
-
-    # Create another temporary audio file
-    temp_audio2 = os.path.join(temp_dir, '2.wav')
-    with open(temp_audio2, 'w') as f:
-        f.write('This is another test audio file')
+    # Create two short PCM audio files
+    write_test_wav(os.path.join(temp_dir, '1.wav'), 100)
+    write_test_wav(os.path.join(temp_dir, '2.wav'), 250)
 
     yield temp_dir
 
@@ -85,7 +98,7 @@ def test_interpret_image(setup_files):
     image_content = base64.b64encode(b'This is a test image file').decode('utf-8')
 
     # Use patch to mock the external service call
-    with patch('audiobook.completion', return_value=mock_response) as mock_completion:
+    with patch.object(audiobook.llm_client, 'acompletion', AsyncMock(return_value=mock_response)) as mock_completion:
         response = describe_image(image_uri, figure_name, surrounding_text, model, mode)
         # Check that the mock was called with the correct arguments
         mock_completion.assert_called_once_with(
@@ -116,17 +129,15 @@ def test_concatenate_audio_pydub(setup_audio_files):
     output_file_name = 'output.wav'
     verbose = 1
 
-    # Create a mock AudioSegment
-    mock_audio_segment = MagicMock()
+    output_path = concatenate_audio_pydub(path, output_file_name, verbose)
+    with wave.open(output_path, 'rb') as f:
+        assert f.getnframes() == 350
+        assert f.getframerate() == 24000
 
-    # Use patch to mock the AudioSegment.from_file method
-    with patch('pydub.AudioSegment.from_file', return_value=mock_audio_segment):
-        try:
-            concatenate_audio_pydub(path, output_file_name, verbose)
-            assert True
-        except Exception as e:
-            print(e)
-            assert False
+    # re-running ignores and overwrites the previous output
+    concatenate_audio_pydub(path, output_file_name, verbose)
+    with wave.open(output_path, 'rb') as f:
+        assert f.getnframes() == 350
 
 def test_page_reading(setup_files, setup_page_image):
     path, _ = setup_files
@@ -220,4 +231,173 @@ def test_page_methods(setup_files, setup_page_image):
             assert True
         except Exception as e:
             print(e)
-            assert False
\ No newline at end of file
+            assert False
+
+def test_tts_worker_loads_model_once():
+    worker = TTSWorker()
+    with patch('audiobook.setup_tts', return_value=MagicMock()) as mock_setup, \
+         patch('audiobook.make_page_reading', return_value='combined.wav'):
+        for page_number in range(3):
+            worker.read_page(['one chunk', 'two chunk'], 'outputs/pages/0/audio', page_number)
+    mock_setup.assert_called_once()
+    stats = worker.stats()
+    assert stats['pages_read'] == 3
+    assert stats['chars_read'] == 3 * len('one chunktwo chunk')
+
+
+def test_speaker_latents_computed_once(setup_files, monkeypatch):
+    _, speaker_wav = setup_files
+    monkeypatch.setenv('TTS_HOME', os.path.dirname(speaker_wav))
+    tts = MagicMock()
+    tts.synthesizer.tts_model.get_conditioning_latents.return_value = ('gpt_latent', 'embedding')
+    with patch('audiobook.torch') as mock_torch:
+        mock_torch.save.side_effect = lambda obj, path: open(path, 'wb').close()
+        first = get_speaker_latents(tts, speaker_wav)
+        second = get_speaker_latents(tts, speaker_wav)
+    tts.synthesizer.tts_model.get_conditioning_latents.assert_called_once_with(audio_path=[speaker_wav])
+    assert first is second
+    assert first['gpt_cond_latent'] == 'gpt_latent'
+
+
+def test_describe_image_uses_response_cache(setup_files):
+    image_uri, _ = setup_files
+    mock_choice = MagicMock()
+    mock_choice.message.content = "Mocked description of the image"
+    mock_response = MagicMock()
+    mock_response.choices = [mock_choice]
+
+    with patch.object(audiobook.llm_client, 'acompletion', AsyncMock(return_value=mock_response)) as mock_completion:
+        first = describe_image(image_uri, "Figure 1.1", "Some text", "gpt-4-vision-preview")
+        second = describe_image(image_uri, "Figure 1.1", "Some text", "gpt-4-vision-preview")
+        describe_image(image_uri, "Figure 1.1", "Other text", "gpt-4-vision-preview")
+    assert first == second == "Mocked description of the image"
+    assert mock_completion.call_count == 2
+    assert audiobook.llm_cache.stats()['hits'] == 1
+
+
+def test_unparsed_figure_reply_is_kept_once():
+    mock_choice = MagicMock()
+    mock_choice.message.content = "Two charts of sales by year"
+    mock_response = MagicMock()
+    mock_response.choices = [mock_choice]
+    figure_images = {"2.1": (b"first", "image/jpeg"), "2.2": (b"second", "image/jpeg")}
+
+    with patch.object(audiobook.llm_client, 'acompletion', AsyncMock(return_value=mock_response)):
+        descriptions = audiobook.run_sync(audiobook.adescribe_figures(figure_images, "Some text"))
+    assert descriptions == {"2.1": "Two charts of sales by year", "2.2": ""}
+
+
+def test_figure_description_is_kept_when_cleanup_fails(tmp_path):
+    registry = FigureRegistry(str(tmp_path / 'figures'))
+    working_page = MagicMock()
+    working_page.detect_figures.return_value = [MagicMock(figure_name="2.1")]
+    working_page.acleanup = AsyncMock(side_effect=RuntimeError("cleanup failed"))
+    working_page.page_text = "Some text"
+
+    with patch('audiobook.Page', return_value=working_page), \
+         patch('audiobook.adescribe_figures', AsyncMock(return_value={"2.1": "A chart"})):
+        with pytest.raises(RuntimeError):
+            audiobook.run_sync(audiobook.amake_page(registry, None, 12))
+    # the retry reuses the stored description instead of paying for another vision call
+    assert registry.description("2.1") == "A chart"
+    assert registry.claim("2.1", 12)
+
+
+def test_page_stages_run_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('USER', 'max')
+    fitz_page = MagicMock()
+    fitz_page.get_text.side_effect = lambda option='text': (
+        {'blocks': []} if option == 'dict' else 'Chapter 1\nSome page text'
+    )
+    fitz_page.get_pixmap.return_value.save.side_effect = lambda path: open(path, 'wb').close()
+
+    with patch('audiobook.adescribe_image', AsyncMock(return_value='Cleaned text')) as mock_describe, \
+         patch.object(audiobook.text_quality, 'needs_cleanup', return_value=True):
+        page = Page(fitz_page, 3, {'header': 'Chapter 1\n', 'footer': None})
+        assert page.page_text == 'Some page text'
+        assert page.cleaned_text == 'Cleaned text'
+        assert page.cleaned_text == 'Cleaned text'
+        # a fresh Page for the same text reuses the saved cleanup and the saved image
+        again = Page(fitz_page, 3, {'header': 'Chapter 1\n', 'footer': None})
+        assert again.cleaned_text == 'Cleaned text'
+    mock_describe.assert_called_once()
+    fitz_page.get_pixmap.assert_called_once()
+    fitz_page.get_text.assert_called()
+
+
+def test_saved_cleanup_is_redone_when_the_prompt_version_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('USER', 'max')
+    fitz_page = MagicMock()
+    fitz_page.get_text.side_effect = lambda option='text': (
+        {'blocks': []} if option == 'dict' else 'Chapter 1\nSome page text'
+    )
+    fitz_page.get_pixmap.return_value.save.side_effect = lambda path: open(path, 'wb').close()
+
+    with patch('audiobook.adescribe_image', AsyncMock(return_value='Cleaned text')) as mock_describe, \
+         patch.object(audiobook.text_quality, 'needs_cleanup', return_value=True):
+        assert Page(fitz_page, 3, {'header': 'Chapter 1\n', 'footer': None}).cleaned_text == 'Cleaned text'
+        monkeypatch.setitem(audiobook.PROMPT_VERSIONS, 'general_cleanup', 'bumped')
+        assert Page(fitz_page, 3, {'header': 'Chapter 1\n', 'footer': None}).cleaned_text == 'Cleaned text'
+    assert mock_describe.call_count == 2
+
+
+def test_split_sentences_keeps_decimals_and_abbreviations():
+    text = "Dr. Smith measured 3.14 units, e.g. in Figure 1.2. It worked! Then J. Tolkien wrote \"Hello.\" Done?"
+    assert split_sentences(text) == [
+        "Dr. Smith measured 3.14 units, e.g. in Figure 1.2.",
+        "It worked!",
+        "Then J. Tolkien wrote \"Hello.\"",
+        "Done?",
+    ]
+
+
+def test_chunk_text_packs_whole_sentences():
+    text = "First sentence here. Second one. " + "word " * 60 + "end. Last."
+    chunks, _ = chunk_text(text, 100, None)
+    assert chunks[0] == "First sentence here. Second one."
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+    # deterministic
+    assert chunk_text(text, 100, None)[0] == chunks
+
+
+def test_clean_page_skips_cleanup_llm(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('USER', 'max')
+    fitz_page = MagicMock()
+    fitz_page.get_text.side_effect = lambda option='text': (
+        {'blocks': []} if option == 'dict' else 'A plain page of prose with a hyphen-\nated word.'
+    )
+
+    with patch('audiobook.adescribe_image', AsyncMock()) as mock_describe:
+        page = Page(fitz_page, 4)
+        assert page.cleaned_text == 'A plain page of prose with a hyphenated word.'
+        assert page.return_pydantic_page().llm_cleanup is False
+    mock_describe.assert_not_called()
+
+
+def test_page_reading_synthesizes_only_uncached_chunks(tmp_path, setup_files):
+    _, speaker_wav = setup_files
+    tts = MagicMock()
+    tts.synthesizer.save_wav.side_effect = lambda wav, path: write_test_wav(path, wav)
+    audio_dir = str(tmp_path / 'audio')
+    os.makedirs(audio_dir)
+    write_test_wav(os.path.join(audio_dir, '5.wav'), 999)  # left from a longer reading
+
+    def synthesize(tts, chunks, latents, **kwargs):
+        return [10 * len(chunk) for chunk in chunks]
+
+    with patch('audiobook.get_speaker_latents', return_value={}), \
+         patch('audiobook.audio_file_name', lambda stem: stem + '.wav'), \
+         patch('audiobook.synthesize_chunks', side_effect=synthesize) as mock_synthesize:
+        make_page_reading(tts, ['Chapter one.', 'Some text.', 'Chapter  one.'], audio_dir, 0, speaker_wav)
+        make_page_reading(tts, ['Chapter one.', 'Other text.'], audio_dir, 0, speaker_wav)
+    # repeated chunks are synthesized once per cache miss, whitespace differences included
+    assert mock_synthesize.call_args_list[0].args[1] == ['Chapter one.', 'Some text.']
+    assert mock_synthesize.call_args_list[1].args[1] == ['Other text.']
+    assert sorted(os.listdir(audio_dir)) == ['0.wav', '1.wav', 'combined.wav']
+    with wave.open(os.path.join(audio_dir, 'combined.wav')) as f:
+        assert f.getnframes() == 120 + 110
+    assert audiobook.audio_cache.stats()['hits'] == 1
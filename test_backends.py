@@ -0,0 +1,23 @@
+import asyncio
+from backends import InMemoryDict, SQLiteDict
+
+
+def test_in_memory_dict():
+    working_doc = InMemoryDict()
+    asyncio.run(working_doc.put("figures", ["figure-1"]))
+    assert asyncio.run(working_doc.get("figures")) == ["figure-1"]
+    assert asyncio.run(working_doc.get("chapters")) is None
+
+
+def test_sqlite_dict_survives_reopening(tmp_path):
+    path = str(tmp_path / "working_doc.sqlite")
+    working_doc = SQLiteDict(path)
+    asyncio.run(working_doc.put("chapters", {"chapter_number": 1, "pages": (1, 20)}))
+    asyncio.run(working_doc.put("figures", []))
+    asyncio.run(working_doc.put("figures", ["figure-1"]))
+    working_doc.close()
+
+    reopened = SQLiteDict(path)
+    assert asyncio.run(reopened.get("chapters")) == {"chapter_number": 1, "pages": (1, 20)}
+    assert asyncio.run(reopened.get("figures")) == ["figure-1"]
+    assert asyncio.run(reopened.get("missing", [])) == []
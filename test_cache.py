@@ -0,0 +1,61 @@
+import os
+import time
+from cache import DiskCache, file_sha256, saved_file_sha256
+
+
+def test_get_put_and_counters(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    key = DiskCache.key("gpt-4o", "general_cleanup", 1, "text", None)
+    assert cache.get(key) is None
+    cache.put(key, b"cleaned text")
+    assert cache.get(key) == b"cleaned text"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "evictions": 0}
+
+
+def test_key_depends_on_every_part():
+    base = DiskCache.key("model", "prompt", 1, "text", "image-hash")
+    assert base == DiskCache.key("model", "prompt", 1, "text", "image-hash")
+    assert base != DiskCache.key("model", "prompt", 2, "text", "image-hash")
+    assert base != DiskCache.key("model", "prompt", 1, "text", None)
+    assert DiskCache.key("text", None) != DiskCache.key("text", "")
+    assert DiskCache.key("ab", "c") != DiskCache.key("a", "bc")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    keys = [DiskCache.key(i) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, b"x" * 100)
+        past = time.time() - 100 + i
+        os.utime(cache._path(key), (past, past))
+    cache.get(keys[0])  # the first entry is now the most recently used
+    cache.put(keys[2], b"x" * 100)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_down_to_low_water(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000, low_water=0.8)
+    for i in range(11):
+        cache.put(DiskCache.key(i), b"x" * 100)
+    # over the cap once, then evicted to 800 bytes, so the next puts fit without another scan
+    assert cache.stats()["evictions"] == 3
+    assert cache.size() == 800
+    cache.put(DiskCache.key(11), b"x" * 100)
+    cache.put(DiskCache.key(12), b"x" * 100)
+    assert cache.stats()["evictions"] == 3
+
+
+def test_saved_file_digest_follows_file_changes(tmp_path):
+    path = str(tmp_path / "combined.opus")
+    with open(path, "wb") as f:
+        f.write(b"first")
+    digest = saved_file_sha256(path)
+    assert digest == file_sha256(path)
+    assert os.path.exists(path + ".sha256")
+    assert saved_file_sha256(path) == digest
+    with open(path, "wb") as f:
+        f.write(b"second, longer")
+    assert saved_file_sha256(path) == file_sha256(path) != digest
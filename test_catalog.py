@@ -0,0 +1,69 @@
+import os
+import wave
+from catalog import Catalog
+
+
+def write_wav(path, frames, framerate=24000):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(framerate)
+        f.writeframes(b'\x01\x00' * frames)
+
+
+def test_latest_record_per_page_wins(tmp_path):
+    catalog = Catalog(str(tmp_path / 'catalog'))
+    for page_number in range(5):
+        path = str(tmp_path / f'{page_number}.wav')
+        write_wav(path, 2400)
+        catalog.record(page_number, path, chapter_number=1 if page_number < 3 else 2)
+    write_wav(str(tmp_path / '1.wav'), 4800)
+    catalog.record(1, str(tmp_path / '1.wav'), chapter_number=1)
+    catalog.remove(4)
+
+    entries, total = catalog.list()
+    assert total == 4
+    assert [entry['page_number'] for entry in entries] == [0, 1, 2, 3]
+    assert entries[1]['duration'] == 0.2
+    assert entries[1]['codec'] == 'wav'
+    assert entries[1]['size'] == os.path.getsize(tmp_path / '1.wav')
+
+    entries, total = catalog.list(chapter_number=1, offset=1, limit=1)
+    assert [entry['page_number'] for entry in entries] == [1] and total == 3
+    newest = max(entry['mtime'] for entry in catalog.entries().values())
+    assert catalog.list(modified_since=newest) == ([], 0)
+
+
+def test_reader_sees_appends_and_a_torn_record_only_loses_itself(tmp_path):
+    directory = str(tmp_path / 'catalog')
+    writer = Catalog(directory)
+    reader = Catalog(directory)
+    write_wav(str(tmp_path / '0.wav'), 100)
+    writer.record(0, str(tmp_path / '0.wav'))
+    assert list(reader.entries()) == [0]
+    with open(writer.writer_path, 'a') as f:
+        f.write('{"page_number": 1, "chapter')  # a writer that died mid-record
+    assert list(reader.entries()) == [0]
+    writer.record(2, str(tmp_path / '0.wav'))
+    # the record after the torn one starts on its own line and survives
+    assert sorted(reader.entries()) == [0, 2]
+    writer.compact()
+    assert sorted(reader.entries()) == [0, 2]
+    assert os.listdir(directory) == ['compacted.jsonl']
+    with open(os.path.join(directory, 'compacted.jsonl')) as f:
+        assert len(f.readlines()) == 2
+
+
+def test_each_process_writes_its_own_file_and_the_newest_record_wins(tmp_path):
+    directory = str(tmp_path / 'catalog')
+    first = Catalog(directory)
+    second = Catalog(directory)
+    second.writer_path = os.path.join(directory, 'other-container-1.jsonl')
+    write_wav(str(tmp_path / '3.wav'), 2400)
+    first.record(3, str(tmp_path / '3.wav'), chapter_number=1)
+    write_wav(str(tmp_path / '3.wav'), 4800)
+    second.record(3, str(tmp_path / '3.wav'), chapter_number=1)
+    assert len(os.listdir(directory)) == 2
+    assert Catalog(directory).entries()[3]['duration'] == 0.2
+    first.remove(3)
+    assert Catalog(directory).entries() == {}
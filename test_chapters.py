@@ -0,0 +1,32 @@
+import pytest
+from chapters import Chapter, ChapterMap, header_and_footer_for_page
+
+
+def chapter(number, start, end, header=""):
+    return Chapter(chapter_number=number, chapter_title_header=header, chapter_title_footer="",
+                   chapter_start_page=start, chapter_end_page=end)
+
+
+def test_lookup_by_page():
+    chapters = ChapterMap([chapter(2, 20, 29, "Two"), chapter(1, 10, 19, "One"), chapter(3, 35, 40)])
+    assert [c.chapter_number for c in chapters] == [1, 2, 3]
+    assert chapters.chapter_for_page(10).chapter_number == 1
+    assert chapters.chapter_for_page(29).chapter_number == 2
+    assert chapters.chapter_for_page(40).chapter_number == 3
+    for page_number in [9, 30, 34, 41]:
+        assert chapters.chapter_for_page(page_number) is None
+        assert not chapters.in_scope(page_number)
+    assert chapters.page_numbers() == list(range(10, 30)) + list(range(35, 41))
+
+
+def test_page_outside_every_chapter_has_no_header_or_footer():
+    chapters = ChapterMap([chapter(1, 10, 19, "One")])
+    assert header_and_footer_for_page(chapters, 12) == {"header": "One", "footer": None}
+    assert header_and_footer_for_page(chapters, 50) == {"header": None, "footer": None}
+
+
+def test_overlapping_or_reversed_ranges_are_rejected():
+    with pytest.raises(ValueError):
+        ChapterMap([chapter(1, 10, 20), chapter(2, 20, 30)])
+    with pytest.raises(ValueError):
+        ChapterMap([chapter(1, 10, 5)])
@@ -0,0 +1,112 @@
+import hashlib
+import io
+import os
+import pytest
+from archives import iter_tar
+from downloads import DownloadError, Downloader, parse_range
+
+CONTENT = bytes(range(256)) * 40
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None, fail_after=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.fail_after = fail_after
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("connection reset")
+            yield self.body[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeSession:
+    """Serves CONTENT with Range support; the first response can drop the connection part way"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.requests = []
+
+    def get(self, url, headers, stream, timeout):
+        self.requests.append(headers.get("Range"))
+        headers_out = {"X-Content-SHA256": SHA256}
+        span = parse_range(headers.get("Range"), len(CONTENT))
+        fail_after, self.fail_after = self.fail_after, None
+        if span is None:
+            return FakeResponse(200, CONTENT, headers_out, fail_after)
+        return FakeResponse(206, CONTENT[span[0]:span[1] + 1], headers_out, fail_after)
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-", 100) == (10, 99)
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=-30", 100) == (70, 99)
+    assert parse_range("bytes=90-200", 100) == (90, 99)
+    assert parse_range("bytes=50-10", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=-0", 100)
+
+
+def test_interrupted_download_resumes_with_range(tmp_path):
+    session = FakeSession(fail_after=4096)
+    downloader = Downloader(chunk_size=1024, session=session)
+    path = str(tmp_path / "12.opus")
+    with pytest.raises(ConnectionError):
+        downloader.fetch("https://example/12", path, len(CONTENT))
+    downloader.fetch("https://example/12", path, len(CONTENT))
+    assert session.requests == [None, "bytes=4096-"]
+    with open(path, "rb") as f:
+        assert f.read() == CONTENT
+    assert downloader.bytes_downloaded == len(CONTENT)
+    # a finished file with the right digest is not fetched again
+    downloader.fetch("https://example/12", path, len(CONTENT), SHA256)
+    assert len(session.requests) == 2
+
+
+def test_checksum_mismatch_discards_the_file(tmp_path):
+    downloader = Downloader(session=FakeSession())
+    path = str(tmp_path / "12.opus")
+    with pytest.raises(DownloadError):
+        downloader.fetch("https://example/12", path, len(CONTENT), sha256="0" * 64)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fetch_all_reports_failures(tmp_path, monkeypatch):
+    monkeypatch.setattr("downloads.time.sleep", lambda seconds: None)
+    downloader = Downloader(workers=4, retries=1, session=FakeSession())
+    downloads = [("https://example/{0}".format(n), str(tmp_path / "{0}.opus".format(n)), len(CONTENT), None)
+                 for n in range(6)]
+    downloads[2] = downloads[2][:2] + (len(CONTENT) + 1, None)
+    failures = downloader.fetch_all(downloads)
+    assert list(failures) == [downloads[2][1]]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0.opus", "1.opus", "2.opus.part", "3.opus", "4.opus", "5.opus"]
+
+
+def test_archive_is_unpacked_as_it_streams(tmp_path):
+    source = str(tmp_path / "source")
+    with open(source, "wb") as f:
+        f.write(CONTENT)
+    archive = b"".join(iter_tar([("3.opus", source, SHA256), ("4.opus", source, None)]))
+
+    class ArchiveSession:
+        def get(self, url, params, stream, timeout):
+            assert params == {"start_page": 3, "end_page": 4}
+            response = FakeResponse(200)
+            response.raw = io.BufferedReader(io.BytesIO(archive))
+            return response
+
+    paths = Downloader(session=ArchiveSession()).fetch_archive(
+        "https://example/archive", str(tmp_path / "out"), {"start_page": 3, "end_page": 4})
+    assert [os.path.basename(path) for path in paths] == ["3.opus", "4.opus"]
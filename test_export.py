@@ -0,0 +1,67 @@
+import os
+import wave
+from types import SimpleNamespace
+from unittest.mock import patch
+from audio import open_encoder
+from export import export_book, export_chapters, page_audio_paths
+
+
+def write_wav(path, frames, framerate=24000):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(framerate)
+        f.writeframes(b'\x01\x00' * frames)
+
+
+def chapter(number, start, end, header=''):
+    return SimpleNamespace(chapter_number=number, chapter_title_header=header, chapter_title_footer='',
+                           chapter_start_page=start, chapter_end_page=end)
+
+
+def frames(path):
+    with wave.open(path, 'rb') as f:
+        return f.getnframes()
+
+
+def test_chapters_take_pages_from_their_ranges(tmp_path):
+    pages = tmp_path / 'pages'
+    os.makedirs(pages)
+    for page_number in [1, 2, 3, 5]:
+        write_wav(str(pages / f'{page_number}.wav'), 100 * page_number)
+    write_wav(str(pages / 'chapter_1.wav'), 999)  # output of an earlier export is not a page
+    page_audio = page_audio_paths(str(pages))
+    assert sorted(page_audio) == [1, 2, 3, 5]
+
+    exported = export_chapters([chapter(2, 3, 5), chapter(1, 1, 2)], page_audio, str(tmp_path / 'out'), 'wav')
+    assert [os.path.basename(path) for path in exported] == ['chapter_1.wav', 'chapter_2.wav']
+    assert [frames(path) for path in exported] == [300, 800]
+
+
+def test_book_export_marks_chapters_on_page_boundaries(tmp_path):
+    for page_number in [1, 2, 3]:
+        write_wav(str(tmp_path / f'{page_number}.wav'), 100 * page_number)
+    page_audio = page_audio_paths(str(tmp_path))
+    chapters = [chapter(1, 1, 1, 'Beginnings'), chapter(2, 2, 3)]
+
+    # WAV can't hold chapter markers, so the pages are just joined
+    assert frames(export_book(chapters, page_audio, str(tmp_path / 'book.wav'))) == 600
+
+    remuxed = []
+
+    def remux(command, check):
+        with open(command[command.index('-map') - 1]) as f:
+            remuxed.append((f.read(), command[-1]))
+
+    # no ffmpeg here: encode the book as WAV under its .m4b name and capture the remux
+    with patch('export.open_encoder', lambda path, *params, **kwargs: open_encoder(path, *params, codec='wav')), \
+         patch('export.subprocess.run', side_effect=remux):
+        export_book(chapters, page_audio, str(tmp_path / 'book.m4b'), title='A; book')
+    assert remuxed == [(
+        ';FFMETADATA1\ntitle=A\\; book\n'
+        '[CHAPTER]\nTIMEBASE=1/24000\nSTART=0\nEND=100\ntitle=Beginnings\n'
+        '[CHAPTER]\nTIMEBASE=1/24000\nSTART=100\nEND=600\ntitle=Chapter 2\n',
+        str(tmp_path / 'book.m4b'),
+    )]
+    # the intermediate files are cleaned up
+    assert sorted(os.listdir(tmp_path)) == ['1.wav', '2.wav', '3.wav', 'book.wav']
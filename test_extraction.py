@@ -0,0 +1,38 @@
+import os
+from conftest import FakePage, text_block
+from extraction import ExtractedPage, extract_page
+from layout import detect_running_lines
+
+
+def figure_page():
+    return FakePage(
+        [
+            text_block((50, 20, 550, 40), "Chapter 1"),
+            text_block((100, 410, 500, 430), "Figure 1.1 Sales by year"),
+            {"type": 1, "bbox": (100, 150, 500, 400), "image": b"\x89PNG raw bytes"},
+        ],
+        images=[(7, (100, 150, 500, 400))],
+    )
+
+
+def test_extracted_page_stands_in_for_the_pdf_page(tmp_path):
+    extract_page(figure_page(), 3, str(tmp_path))
+    page = ExtractedPage.load(str(tmp_path), 3)
+    assert page.get_text() == "Chapter 1\nFigure 1.1 Sales by year\n"
+    assert page.get_text("dict")["blocks"][2] == {"type": 1, "bbox": [100, 150, 500, 400]}
+    assert [figure.figure_name for figure in page.figures] == ["1.1"]
+    assert page.figures[0].bbox == (100, 150, 500, 430)
+    assert page.figure_image("1.1") == (b"jpeg", "image/jpeg")
+    assert os.path.exists(tmp_path / "pages" / "3" / "image" / "page.png")
+    # layout detection reads the artifact like a fitz page
+    assert detect_running_lines([(3, page)], min_pages=1) == {3: [[50, 20, 550, 40]]}
+
+
+def test_unchanged_page_is_not_extracted_again(tmp_path):
+    page = figure_page()
+    extract_page(page, 3, str(tmp_path))
+    extract_page(page, 3, str(tmp_path))
+    assert page.renders == 2  # the page and its figure, once
+    page.contents = b"changed"
+    extract_page(page, 3, str(tmp_path))
+    assert page.renders == 4
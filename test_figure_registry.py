@@ -0,0 +1,56 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from figure_registry import FigureRegistry
+
+
+def test_only_one_page_claims_a_figure(tmp_path):
+    directory = str(tmp_path / "figures")
+    # a registry per page, as if every page were building in its own container
+    with ThreadPoolExecutor(16) as executor:
+        claims = list(executor.map(lambda page_number: FigureRegistry(directory).claim("2.1", page_number), range(200)))
+    assert claims.count(True) == 1
+    owner = claims.index(True)
+    assert FigureRegistry(directory).owner("2.1") == owner
+    assert "2.1" in FigureRegistry(directory)
+    assert "2.2" not in FigureRegistry(directory)
+
+
+def test_descriptions_are_stored_per_figure(tmp_path):
+    registry = FigureRegistry(str(tmp_path))
+    assert registry.claim("2.1", 12)
+    assert registry.claim("2.2", 12)
+    registry.record("2.1", 12, "A histogram")
+    registry.record("2.2", 12, "A scatter plot")
+
+    reopened = FigureRegistry(str(tmp_path))
+    assert reopened.description("2.1") == "A histogram"
+    assert reopened.description("2.2") == "A scatter plot"
+    assert reopened.description("2.3") is None
+    # the page that described a figure keeps it when it is rebuilt; other pages never get it
+    assert reopened.claim("2.1", 12)
+    assert not reopened.claim("2.1", 13)
+
+
+def test_released_and_stale_claims_can_be_claimed_again(tmp_path):
+    registry = FigureRegistry(str(tmp_path), stale_seconds=60)
+    assert registry.claim("2.1", 12)
+    assert not registry.claim("2.1", 13)
+    registry.release("2.1", 12)
+    assert registry.claim("2.1", 13)
+
+    # a claim whose page died long ago, without a description
+    assert registry.claim("3.1", 20)
+    old = time.time() - 120
+    os.utime(os.path.join(str(tmp_path), "3.1.claim"), (old, old))
+    assert registry.claim("3.1", 21)
+    assert registry.owner("3.1") == 21
+
+
+def test_unsafe_figure_names(tmp_path):
+    registry = FigureRegistry(str(tmp_path))
+    assert registry.claim("../1 2", 1)
+    assert registry.claim("../1_2", 2)
+    assert os.listdir(str(tmp_path)) and all(os.sep not in name for name in os.listdir(str(tmp_path)))
+    assert registry.owner("../1 2") == 1
+    assert registry.owner("../1_2") == 2
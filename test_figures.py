@@ -0,0 +1,58 @@
+from conftest import FakePage, text_block
+from figures import detect_figures
+
+
+def test_caption_next_to_image_is_a_figure():
+    page = FakePage(
+        [
+            text_block((50, 50, 550, 100), "As Figure 1.1 and Figure 1.2 show, the trend is clear."),
+            text_block((100, 410, 500, 430), "Figure 1.1 Sales by year"),
+        ],
+        images=[(7, (100, 150, 500, 400))],
+    )
+    figures = detect_figures(page)
+    assert [figure.figure_name for figure in figures] == ["1.1"]
+    assert figures[0].bbox == (100, 150, 500, 430)
+
+
+def test_drawn_figure_and_background_fill():
+    page = FakePage(
+        [text_block((100, 80, 500, 100), "Figure 2.3: A diagram")],
+        # a page-sized background and a chart made of pieces
+        drawings=[(0, 0, 600, 800), (100, 110, 300, 300), (302, 110, 500, 300)],
+    )
+    figures = detect_figures(page)
+    assert [figure.figure_name for figure in figures] == ["2.3"]
+    assert figures[0].bbox == (100, 80, 500, 300)
+
+
+def test_caption_without_graphic_is_not_a_figure():
+    page = FakePage(
+        [text_block((100, 410, 500, 430), "Figure 3.1 Missing")],
+        drawings=[(100, 700, 110, 702)],  # a rule, too small to be a figure
+    )
+    assert detect_figures(page) == []
+
+
+def test_figure_crop_fits_token_budget():
+    from figures import prepare_figure_image, vision_tokens
+
+    class Pixmap:
+        def __init__(self, clip, dpi):
+            self.width = int((clip[2] - clip[0]) * dpi / 72)
+            self.height = int((clip[3] - clip[1]) * dpi / 72)
+
+        def tobytes(self, output, jpg_quality):
+            assert output == "jpeg"
+            return b"x" * (self.width * self.height * jpg_quality // 1000)
+
+    class Page:
+        def get_pixmap(self, clip, dpi, alpha):
+            self.pixmap = Pixmap(clip, dpi)
+            return self.pixmap
+
+    page = Page()
+    image, mime_type = prepare_figure_image(page, (0, 0, 500, 700), dpi=300, max_tokens=765, max_bytes=20000)
+    assert mime_type == "image/jpeg"
+    assert vision_tokens(page.pixmap.width, page.pixmap.height) <= 765
+    assert len(image) <= 20000
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+from benchmarks import LIGHT_MODULES
+
+HEAVY_MODULES = ["torch", "TTS", "litellm", "fitz"]
+
+
+def test_light_modules_do_not_import_ml_stack():
+    # a fresh interpreter, so modules imported by other tests don't count
+    code = (
+        "import sys\n"
+        f"for module in {LIGHT_MODULES!r}:\n"
+        "    __import__(module)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
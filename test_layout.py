@@ -0,0 +1,37 @@
+from conftest import FakePage, text_block
+from layout import detect_running_lines, running_line_key, text_without_lines
+
+
+def chapter_page(page_number, body):
+    return FakePage(
+        [
+            text_block((50, 20, 550, 40), "Chapter 3. Growth"),
+            text_block((50, 100, 550, 700), body),
+            text_block((290, 760, 310, 780), str(page_number)),
+        ]
+    )
+
+
+def test_running_line_key_ignores_page_numbers():
+    assert running_line_key("Chapter 3 — page 12") == running_line_key("Chapter  3 — page 13")
+    assert running_line_key("xiv") == "#"
+    assert running_line_key("MCMXC") == "#"
+    for word in ["did", "mid", "civil", "dim", "i did"]:
+        assert running_line_key(word) == word
+
+
+def test_repeated_header_and_page_number_are_masked():
+    pages = [(n, chapter_page(n, f"Body text of page {n}.")) for n in range(10, 15)]
+    # a heading that only opens the chapter stays
+    pages[0][1].blocks.insert(0, text_block((50, 50, 550, 80), "Growth"))
+    masks = detect_running_lines(pages)
+    assert masks[10] == [[50, 20, 550, 40], [290, 760, 310, 780]]
+    assert all(len(mask) == 2 for mask in masks.values())
+
+    blocks = pages[0][1].get_text("dict")["blocks"]
+    assert text_without_lines(blocks, masks[10]) == "Growth\nBody text of page 10.\n"
+
+
+def test_lines_on_too_few_pages_are_kept():
+    pages = [(n, FakePage([text_block((50, 20, 550, 40), f"Section {chr(65 + n)}")])) for n in range(4)]
+    assert detect_running_lines(pages) == {n: [] for n in range(4)}
@@ -0,0 +1,90 @@
+import asyncio
+from unittest.mock import MagicMock
+from llm_client import AsyncLLMClient, TokenBucket, run_sync
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def make_response(text):
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = text
+    return response
+
+
+class FakeClient(AsyncLLMClient):
+    def __init__(self, failures=0, **kwargs):
+        super().__init__(base_delay=0.001, **kwargs)
+        self.failures = failures
+        self.sent = []
+
+    async def acompletion(self, **params):
+        self.sent.append(params)
+        await asyncio.sleep(0.01)
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError("429")
+        return make_response("ok: " + params["messages"][0]["content"])
+
+
+def request(text):
+    return {"model": "gpt-4o", "max_tokens": 10, "messages": [{"content": text, "role": "user"}]}
+
+
+def test_identical_requests_in_flight_are_coalesced():
+    client = FakeClient()
+
+    async def run():
+        return await asyncio.gather(*[client.complete(**request("same")) for _ in range(5)],
+                                    client.complete(**request("other")))
+
+    results = asyncio.run(run())
+    assert results == ["ok: same"] * 5 + ["ok: other"]
+    assert len(client.sent) == 2
+    assert client.stats()["coalesced"] == 4
+
+
+def test_rate_limit_errors_are_retried():
+    client = FakeClient(failures=2)
+    assert run_sync(client.complete(**request("page"))) == "ok: page"
+    assert client.stats()["retries"] == 2
+
+
+def test_other_errors_are_not_retried():
+    class BadRequest(FakeClient):
+        async def acompletion(self, **params):
+            self.sent.append(params)
+            raise ValueError("bad request")
+
+    client = BadRequest()
+    try:
+        run_sync(client.complete(**request("page")))
+        assert False
+    except ValueError:
+        pass
+    assert len(client.sent) == 1
+
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(per_minute=6000)  # 100 a second
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.acquire(6000)
+        await bucket.acquire(5)
+        return loop.time() - start
+
+    assert asyncio.run(run()) >= 0.04
+
+
+def test_run_sync_inside_running_loop():
+    async def inner():
+        return 1
+
+    async def outer():
+        return run_sync(inner())
+
+    assert asyncio.run(outer()) == 1
@@ -0,0 +1,48 @@
+from manifest import Manifest
+
+FINGERPRINT = {
+    "pdf_page": "abc",
+    "header": "Chapter 1",
+    "footer": None,
+    "prompt_version": "{}",
+    "speaker": "voice-1",
+}
+
+
+def test_stage_and_outputs_tracked(tmp_path):
+    manifest = Manifest(str(tmp_path / "book"))
+    image = tmp_path / "page.png"
+    image.write_bytes(b"png")
+    audio = tmp_path / "combined.wav"
+
+    assert not manifest.is_done(3, "extracted", FINGERPRINT)
+    manifest.record(3, "extracted", FINGERPRINT, {"image": str(image)}, {"page_number": 3})
+    assert manifest.is_done(3, "extracted", FINGERPRINT)
+    assert not manifest.is_done(3, "read_aloud", FINGERPRINT)
+
+    manifest.record(3, "read_aloud", FINGERPRINT, {"audio": str(audio)})
+    # the recorded audio is missing from disk, so the stage still needs to run
+    assert not manifest.is_done(3, "read_aloud", FINGERPRINT)
+    audio.write_bytes(b"wav")
+    assert manifest.is_done(3, "read_aloud", FINGERPRINT)
+    assert manifest.get(3)["page"] == {"page_number": 3}
+
+
+def test_changed_inputs_invalidate_only_dependent_stages(tmp_path):
+    manifest = Manifest(str(tmp_path / "book"))
+    image = tmp_path / "page.png"
+    audio = tmp_path / "combined.wav"
+    image.write_bytes(b"png")
+    audio.write_bytes(b"wav")
+    manifest.record(1, "extracted", FINGERPRINT, {"image": str(image)})
+    manifest.record(1, "read_aloud", FINGERPRINT, {"audio": str(audio)})
+
+    new_speaker = dict(FINGERPRINT, speaker="voice-2")
+    assert manifest.is_done(1, "extracted", new_speaker)
+    assert not manifest.is_done(1, "read_aloud", new_speaker)
+
+    new_header = dict(FINGERPRINT, header="Chapter One")
+    assert not manifest.is_done(1, "extracted", new_header)
+    # re-extracting resets the page to its first stage
+    manifest.record(1, "extracted", new_header, {"image": str(image)})
+    assert not manifest.is_done(1, "read_aloud", new_header)
@@ -0,0 +1,98 @@
+import asyncio
+from backends import InMemoryDict
+from pipeline import convert_book, run_pages, PageFailed
+
+
+def test_results_in_page_order_with_retries():
+    attempts = {}
+
+    async def extract(page_number):
+        attempts[page_number] = attempts.get(page_number, 0) + 1
+        if page_number == 2 and attempts[page_number] == 1:
+            raise RuntimeError("transient")
+        # later pages finish first
+        await asyncio.sleep(0.01 * (5 - page_number))
+        return {"page_number": page_number}
+
+    async def tts(page_json):
+        return page_json["page_number"] * 10
+
+    results = asyncio.run(run_pages(range(5), extract, tts, concurrency=5, tts_concurrency=2, retries=1))
+    assert results == [0, 10, 20, 30, 40]
+    assert attempts[2] == 2
+
+
+def test_failed_page_does_not_stop_run():
+    async def extract(page_number):
+        return {"page_number": page_number}
+
+    async def tts(page_json):
+        if page_json["page_number"] == 1:
+            raise ValueError("bad page")
+        return page_json["page_number"]
+
+    results = asyncio.run(run_pages(range(3), extract, tts, retries=0))
+    assert results[0] == 0 and results[2] == 2
+    assert isinstance(results[1], PageFailed)
+    assert results[1].stage == "tts"
+
+
+def test_stages_overlap():
+    running = {"extract": 0, "tts": 0}
+    overlapped = []
+
+    async def extract(page_number):
+        running["extract"] += 1
+        await asyncio.sleep(0.01 * page_number)
+        running["extract"] -= 1
+        return {"page_number": page_number}
+
+    async def tts(page_json):
+        running["tts"] += 1
+        overlapped.append(running["extract"] > 0)
+        await asyncio.sleep(0.01)
+        running["tts"] -= 1
+        return page_json["page_number"]
+
+    asyncio.run(run_pages(range(6), extract, tts, concurrency=6, tts_concurrency=1))
+    assert any(overlapped)
+
+
+class FakeChapters(list):
+    def page_numbers(self):
+        return list(self)
+
+
+class FakeBackend:
+    def __init__(self):
+        self.working_doc = InMemoryDict()
+        self.calls = []
+
+    async def download_tts_model(self):
+        self.calls.append("download_tts_model")
+        return True
+
+    async def extract_pdf(self, doc_path, chapters, page_numbers):
+        self.calls.append("extract_pdf")
+        return {n: "mask-{0}".format(n) for n in page_numbers}
+
+    async def make_page(self, doc_path, page_number, book_id, strip_mask):
+        assert await self.working_doc.get("chapters") == [1, 2, 3]
+        return {
+            "page_number": page_number,
+            "llm_cleanup": page_number == 1,
+            "read_aloud": page_number == 2,
+            "page_audio_uri": "pages/{0}/{1}".format(page_number, strip_mask),
+        }
+
+    async def read_page_aloud(self, page_json, book_id):
+        return {"page_number": page_json["page_number"], "path": book_id, "stats": None}
+
+
+def test_convert_book_runs_every_stage_on_the_backend():
+    backend = FakeBackend()
+    results = asyncio.run(convert_book(backend, "book.pdf", FakeChapters([1, 2, 3]), "book-id", retries=0))
+    assert backend.calls == ["download_tts_model", "extract_pdf"]
+    assert asyncio.run(backend.working_doc.get("chapters")) == [1, 2, 3]
+    # page 2 was already read aloud, so it is never sent to the TTS stage
+    assert [result["path"] for result in results] == ["book-id", "pages/2/mask-2", "book-id"]
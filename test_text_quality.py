@@ -0,0 +1,38 @@
+from text_quality import TextQualityClassifier, normalize_text
+
+PROSE = (
+    "It was the best of times, it was the worst of times, it was the age of wisdom, it was the "
+    "age of foolishness, it was the epoch of be-\nlief, it was the epoch of incredulity, it was "
+    "the season of Light, it was the season of Darkness. We had everything before us."
+)
+
+
+def test_normalize_text():
+    text = "The ﬁrst exam-\nple (shown here) was cited [3, 4]."
+    assert normalize_text(text) == "The first example, shown here, was cited."
+
+
+def test_prose_skips_cleanup_and_is_counted():
+    classifier = TextQualityClassifier()
+    assert not classifier.needs_cleanup(PROSE)
+    assert classifier.stats() == {"checked": 1, "skipped": 1, "skip_rate": 1.0}
+
+
+def test_math_tables_and_noise_need_cleanup():
+    classifier = TextQualityClassifier()
+    math = "Let the sum of x be at most the integral where α, β ∈ ℝ and ∀ε > 0 holds."
+    table = "Year Sales Growth\n2019 1,204 3.2\n2020 1,388 15.3\n2021 1,502 8.2\n"
+    noise = "Tbe qnick brwn fx jmped ovr tlie lazv dgo " * 8
+    assert classifier.needs_cleanup(math)
+    assert classifier.needs_cleanup(table)
+    assert classifier.needs_cleanup(noise)
+    assert classifier.stats()["skipped"] == 0
+
+
+def test_math_fonts_from_spans():
+    classifier = TextQualityClassifier()
+    blocks = [{"lines": [{"spans": [
+        {"text": PROSE, "font": "Times-Roman"},
+        {"text": "x y z n m k", "font": "CMMI10"},
+    ]}]}]
+    assert classifier.needs_cleanup(PROSE, blocks)
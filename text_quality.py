@@ -0,0 +1,126 @@
+import re
+
+LIGATURES = {
+    "ﬀ": "ff",
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "ﬃ": "ffi",
+    "ﬄ": "ffl",
+    "ﬅ": "st",
+    "ﬆ": "st",
+}
+# Characters extracted text normally contains; anything else counts as a symbol
+PLAIN_CHARACTERS = set(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    " \t\n.,;:!?'\"-()‘’“”–—%$&/"
+)
+MATH_FONTS = ("math", "symbol", "cmsy", "cmmi", "cmex", "msam", "msbm", "stix")
+# The most frequent English words. Running prose hits these for roughly half its words;
+# OCR noise, tables and formulas hit them far less.
+COMMON_WORDS = set(
+    """the of and to a in is it that was for on are as with be by this at from or have an
+    they which one you were her all she there would their we him been has when who will
+    more no if out so said what up its about into than them can only other new some could
+    time these two may then do first any my now such like our over man me even most made
+    after also did many before must through back years where much your way well down should
+    because each just those people how too little state good very make world still own see
+    men work long get here between both life being under never day same another know while
+    last might us great old year off come since against go came right used take three
+    however not but he his i had often""".split()
+)
+HYPHEN_BREAK = re.compile(r"(\w)-\n(\w)")
+CITATION = re.compile(r"\[\d+(?:[,–-]\s*\d+)*\]")
+
+
+def normalize_text(text):
+    """Cheap deterministic cleanup for pages that don't need the LLM: expand ligatures, rejoin
+    words hyphenated across line breaks, drop numeric citations and read brackets as pauses"""
+    for ligature, letters in LIGATURES.items():
+        text = text.replace(ligature, letters)
+    text = HYPHEN_BREAK.sub(r"\1\2", text)
+    text = CITATION.sub("", text)
+    text = re.sub(r"\s*[(\[{]\s*", ", ", text)
+    text = re.sub(r"\s*[)\]}]\s*", ", ", text)
+    text = re.sub(r",\s*([.,;:!?])", r"\1", text)
+    return re.sub(r" ([.,;:!?])", r"\1", " ".join(text.split()))
+
+
+def math_font_ratio(blocks):
+    """Share of the page's characters set in math or symbol fonts, from PyMuPDF text blocks"""
+    total = 0
+    math = 0
+    for block in blocks:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                length = len(span["text"].strip())
+                total += length
+                if any(name in span["font"].lower() for name in MATH_FONTS):
+                    math += length
+    return math / total if total else 0.0
+
+
+def normalize_text_for_scoring(text):
+    """Ligatures are expanded by normalize_text, so they don't count as symbols against a page"""
+    for ligature, letters in LIGATURES.items():
+        text = text.replace(ligature, letters)
+    return text
+
+
+class TextQualityClassifier:
+    """Decides whether a page's extracted text needs the cleanup LLM or only normalize_text.
+    Pages with many symbols, math fonts, table-like numeric lines or few recognizable words go
+    to the LLM; the counters show how many calls were skipped, for tuning the thresholds."""
+
+    def __init__(
+        self,
+        max_symbol_ratio=0.01,
+        max_math_font_ratio=0.01,
+        max_numeric_line_ratio=0.25,
+        min_common_word_ratio=0.3,
+    ):
+        self.max_symbol_ratio = max_symbol_ratio
+        self.max_math_font_ratio = max_math_font_ratio
+        self.max_numeric_line_ratio = max_numeric_line_ratio
+        self.min_common_word_ratio = min_common_word_ratio
+        self.checked = 0
+        self.skipped = 0
+
+    def score(self, text, blocks=None):
+        text = normalize_text_for_scoring(text)
+        characters = [c for c in text if not c.isspace()]
+        symbols = sum(1 for c in characters if c not in PLAIN_CHARACTERS)
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        numeric_lines = sum(1 for line in lines if not re.search(r"[A-Za-z]{3}", line))
+        words = re.findall(r"[A-Za-z]+", text.lower())
+        return {
+            "symbol_ratio": symbols / len(characters) if characters else 0.0,
+            "math_font_ratio": math_font_ratio(blocks) if blocks else 0.0,
+            "numeric_line_ratio": numeric_lines / len(lines) if lines else 0.0,
+            "common_word_ratio": (
+                sum(1 for word in words if word in COMMON_WORDS) / len(words) if words else 0.0
+            ),
+            "hyphen_breaks": len(HYPHEN_BREAK.findall(text)),
+            "words": len(words),
+        }
+
+    def needs_cleanup(self, text, blocks=None):
+        """True when the page should go to the cleanup LLM"""
+        score = self.score(text, blocks)
+        needs = (
+            score["symbol_ratio"] > self.max_symbol_ratio
+            or score["math_font_ratio"] > self.max_math_font_ratio
+            or score["numeric_line_ratio"] > self.max_numeric_line_ratio
+            # too little text to judge the vocabulary, so only the other signals count
+            or (score["words"] >= 30 and score["common_word_ratio"] < self.min_common_word_ratio)
+        )
+        self.checked += 1
+        if not needs:
+            self.skipped += 1
+        return needs
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_rate": self.skipped / self.checked if self.checked else 0.0,
+        }